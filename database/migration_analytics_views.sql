@@ -0,0 +1,307 @@
+-- ====================================================
+-- Netgear Financial Monitor - 数据分析视图与函数
+-- 将脚本中常用的聚合查询下推到数据库执行
+-- ====================================================
+
+-- ====================================================
+-- 索引
+-- ====================================================
+
+-- 按公司取最新季度（ORDER BY fiscal_year DESC, fiscal_quarter DESC LIMIT 1）时按索引顺序读取，无需排序
+CREATE INDEX IF NOT EXISTS idx_financial_data_company_year_quarter ON financial_data(company_id, fiscal_year DESC, fiscal_quarter DESC);
+
+-- 按公司+年度+季度(+分段名称、数据源)查找业务分段时走复合索引，无需合并多个单列索引
+CREATE INDEX IF NOT EXISTS idx_product_line_company_year_quarter ON product_line_revenue(company_id, fiscal_year, fiscal_quarter, category_name, data_source);
+
+-- ====================================================
+-- 数据覆盖视图（用于数据完整性验证）
+-- ====================================================
+
+-- 财务数据覆盖视图：每个公司每个季度一行
+CREATE OR REPLACE VIEW financial_coverage AS
+SELECT
+    fd.company_id,
+    fd.fiscal_year,
+    fd.fiscal_quarter,
+    fd.period,
+    fd.revenue
+FROM financial_data fd
+WHERE fd.fiscal_year IS NOT NULL AND fd.fiscal_quarter IS NOT NULL;
+
+-- 业务分段覆盖视图：每个公司每个季度一行，汇总该季度的分段名称
+CREATE OR REPLACE VIEW segment_coverage AS
+SELECT
+    plr.company_id,
+    plr.fiscal_year,
+    plr.fiscal_quarter,
+    ARRAY_AGG(DISTINCT plr.category_name ORDER BY plr.category_name) as segment_names,
+    COUNT(*) as record_count
+FROM product_line_revenue plr
+WHERE plr.fiscal_year IS NOT NULL AND plr.fiscal_quarter IS NOT NULL
+GROUP BY plr.company_id, plr.fiscal_year, plr.fiscal_quarter;
+
+-- 按数据源汇总的财务数据视图：每个公司每个数据源最近3个季度各一行，附带该数据源的记录总数
+CREATE OR REPLACE VIEW financial_by_source AS
+SELECT
+    ranked.company_id,
+    ranked.data_source,
+    ranked.period,
+    ranked.fiscal_year,
+    ranked.fiscal_quarter,
+    ranked.revenue,
+    ranked.source_count,
+    ranked.source_rank
+FROM (
+    SELECT
+        fd.company_id,
+        fd.data_source,
+        fd.period,
+        fd.fiscal_year,
+        fd.fiscal_quarter,
+        fd.revenue,
+        COUNT(*) OVER (PARTITION BY fd.company_id, fd.data_source) as source_count,
+        ROW_NUMBER() OVER (
+            PARTITION BY fd.company_id, fd.data_source
+            ORDER BY fd.fiscal_year DESC NULLS LAST, fd.fiscal_quarter DESC NULLS LAST
+        ) as source_rank
+    FROM financial_data fd
+) ranked
+WHERE ranked.source_rank <= 3;
+
+-- 按季度汇总的业务分段视图：每条分段记录附带所在季度的总收入、季度由新到旧的排名和公司分段记录总数
+CREATE OR REPLACE VIEW segment_by_period AS
+SELECT
+    plr.company_id,
+    plr.period,
+    plr.fiscal_year,
+    plr.fiscal_quarter,
+    plr.category_name,
+    plr.revenue,
+    plr.revenue_percentage,
+    plr.data_source,
+    plr.yoy_growth,
+    plr.gross_margin,
+    SUM(plr.revenue) OVER (PARTITION BY plr.company_id, plr.period) as period_revenue,
+    DENSE_RANK() OVER (
+        PARTITION BY plr.company_id
+        ORDER BY plr.fiscal_year DESC NULLS LAST, plr.fiscal_quarter DESC NULLS LAST
+    ) as period_rank,
+    COUNT(*) OVER (PARTITION BY plr.company_id) as company_segment_count
+FROM product_line_revenue plr;
+
+-- 最新季度业务分段构成视图：每个公司最新财报季度的业务分段，一次查询即可得到，无需先查最新季度
+CREATE OR REPLACE VIEW latest_segment_mix AS
+SELECT
+    plr.company_id,
+    plr.period,
+    plr.category_name,
+    plr.revenue,
+    plr.revenue_percentage,
+    plr.yoy_growth
+FROM product_line_revenue plr
+JOIN (
+    SELECT DISTINCT ON (fd.company_id) fd.company_id, fd.period
+    FROM financial_data fd
+    WHERE fd.fiscal_year IS NOT NULL
+    ORDER BY fd.company_id, fd.fiscal_year DESC, fd.fiscal_quarter DESC
+) latest ON latest.company_id = plr.company_id AND latest.period = plr.period;
+
+COMMENT ON VIEW financial_coverage IS '财务数据覆盖视图 - 按季度列出已有财务数据';
+COMMENT ON VIEW segment_coverage IS '业务分段覆盖视图 - 按季度汇总分段名称';
+COMMENT ON VIEW financial_by_source IS '按数据源汇总的财务数据视图 - 各数据源记录数及最近3个季度';
+COMMENT ON VIEW segment_by_period IS '按季度汇总的业务分段视图 - 附带季度总收入和季度排名';
+COMMENT ON VIEW latest_segment_mix IS '最新季度业务分段构成视图';
+
+-- ====================================================
+-- 产品线/地理分布估算数据生成（服务端执行）
+-- ====================================================
+
+-- 稳定哈希：md5前8位十六进制转整数，与scripts/generate_missing_product_data.py中的stable_hash一致
+-- （该脚本早先使用crc32，之前生成的估算增长率与本函数的结果不同，需要时删除estimated记录后重新生成）
+CREATE OR REPLACE FUNCTION stable_hash(input TEXT)
+RETURNS BIGINT AS $$
+    SELECT ('x' || SUBSTR(MD5(input), 1, 8))::BIT(32)::BIGINT;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 为缺少产品线数据的财务期间生成产品线和地理分布估算数据
+-- 幂等：已有产品线数据的期间会被跳过，冲突行不做任何修改
+-- 返回插入的产品线记录数
+CREATE OR REPLACE FUNCTION regenerate_product_lines(p_company_id UUID)
+RETURNS INTEGER AS $$
+DECLARE
+    inserted_count INTEGER;
+BEGIN
+    WITH missing AS (
+        SELECT fd.period, fd.fiscal_year, fd.fiscal_quarter, fd.revenue
+        FROM financial_data fd
+        WHERE fd.company_id = p_company_id
+          AND fd.revenue > 0
+          AND NOT EXISTS (
+              SELECT 1 FROM product_line_revenue plr
+              WHERE plr.company_id = p_company_id AND plr.period = fd.period
+          )
+    ),
+    -- 基于NETGEAR地理分布
+    regions(region, country, country_code, pct, latitude, longitude, market_size) AS (
+        VALUES
+            ('北美', 'United States', 'US', 0.55, 37.0902, -95.7129, 12500000000),
+            ('欧洲', 'Germany', 'DE', 0.28, 51.1657, 10.4515, 8200000000),
+            ('亚太', 'Japan', 'JP', 0.17, 36.2048, 138.2529, 5800000000)
+    ),
+    geo AS (
+        INSERT INTO geographic_revenue (
+            company_id, period, fiscal_year, fiscal_quarter, region, country, country_code,
+            revenue, revenue_percentage, market_size, market_share, competitor_count,
+            yoy_growth, qoq_growth, latitude, longitude, data_source
+        )
+        SELECT
+            p_company_id, m.period, m.fiscal_year, m.fiscal_quarter, r.region, r.country, r.country_code,
+            FLOOR(m.revenue * r.pct)::BIGINT,
+            r.pct * 100,
+            r.market_size,
+            FLOOR(m.revenue * r.pct) / r.market_size * 100,
+            15 + stable_hash(r.region) % 10,
+            GREATEST(0, 3 + stable_hash(r.region || m.fiscal_year) % 15 - (2025 - m.fiscal_year) * 1.5),
+            1 + stable_hash(r.region || m.period) % 10,
+            r.latitude, r.longitude, 'estimated'
+        FROM missing m
+        CROSS JOIN regions r
+        ON CONFLICT (company_id, period, region, country) DO NOTHING
+    ),
+    -- 基于NETGEAR业务结构的产品线分布
+    product_lines(category_level, category_name, pct, margin) AS (
+        VALUES
+            (1, '消费级网络产品', 0.68, 28.5),
+            (1, '商用/企业级产品', 0.22, 32.8),
+            (1, '服务与软件', 0.10, 65.5),
+            (2, 'WiFi路由器', 0.40, 28.0),
+            (2, '网络扩展器/Mesh系统', 0.18, 25.0),
+            (2, '网络存储(NAS)', 0.10, 32.0),
+            (2, '企业级路由器', 0.10, 35.0),
+            (2, '交换机', 0.08, 30.0),
+            (2, '无线接入点', 0.04, 38.0),
+            (2, 'Armor安全服务', 0.05, 65.0),
+            (2, 'Insight网络管理', 0.03, 70.0),
+            (2, '其他服务', 0.02, 60.0)
+    )
+    INSERT INTO product_line_revenue (
+        company_id, period, fiscal_year, fiscal_quarter, category_level, category_name,
+        revenue, revenue_percentage, gross_margin, yoy_growth, qoq_growth,
+        data_source, estimation_method
+    )
+    SELECT
+        p_company_id, m.period, m.fiscal_year, m.fiscal_quarter, pl.category_level, pl.category_name,
+        FLOOR(m.revenue * pl.pct)::BIGINT,
+        pl.pct * 100,
+        pl.margin,
+        GREATEST(0, 5 + stable_hash(pl.category_name || m.fiscal_year) % 20 - (2025 - m.fiscal_year) * 2),
+        2 + stable_hash(pl.category_name || m.period) % 15,
+        'estimated', 'historical_financial_based'
+    FROM missing m
+    CROSS JOIN product_lines pl
+    ON CONFLICT (company_id, period, category_name, category_level) DO NOTHING;
+    
+    GET DIAGNOSTICS inserted_count = ROW_COUNT;
+    RETURN inserted_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION regenerate_product_lines(UUID) IS '为缺失期间生成产品线和地理分布估算数据，返回插入的产品线记录数';
+
+-- ====================================================
+-- 数据完整性检查
+-- ====================================================
+
+-- 列出指定范围内（p_start_year Q1 到 p_end_year 第p_end_quarter季度）缺少财务数据或业务分段数据的季度
+CREATE OR REPLACE FUNCTION find_missing_quarters(
+    p_company_id UUID,
+    p_start_year INTEGER,
+    p_end_year INTEGER,
+    p_end_quarter INTEGER
+)
+RETURNS TABLE(fiscal_year INTEGER, fiscal_quarter INTEGER, missing_financial BOOLEAN, missing_segments BOOLEAN) AS $$
+    SELECT expected.y, expected.q, expected.missing_financial, expected.missing_segments
+    FROM (
+        SELECT
+            years.y,
+            quarters.q,
+            NOT EXISTS (
+                SELECT 1 FROM financial_data fd
+                WHERE fd.company_id = p_company_id AND fd.fiscal_year = years.y AND fd.fiscal_quarter = quarters.q
+            ) as missing_financial,
+            NOT EXISTS (
+                SELECT 1 FROM product_line_revenue plr
+                WHERE plr.company_id = p_company_id AND plr.fiscal_year = years.y AND plr.fiscal_quarter = quarters.q
+            ) as missing_segments
+        FROM generate_series(p_start_year, p_end_year) AS years(y)
+        CROSS JOIN generate_series(1, 4) AS quarters(q)
+        WHERE years.y < p_end_year OR quarters.q <= p_end_quarter
+    ) expected
+    WHERE expected.missing_financial OR expected.missing_segments
+    ORDER BY expected.y, expected.q;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION find_missing_quarters(UUID, INTEGER, INTEGER, INTEGER) IS '列出缺少财务数据或业务分段数据的季度';
+
+-- 期间覆盖汇总：财务/分段数据覆盖的期间数、缺少分段数据的期间（EXCEPT）和整体时间范围，一次返回一行
+-- 期间格式为"Qn-YYYY"，按年份再按季度排序
+CREATE OR REPLACE FUNCTION period_coverage_summary(p_company_id UUID)
+RETURNS TABLE(
+    financial_period_count BIGINT,
+    segment_period_count BIGINT,
+    missing_segment_periods TEXT[],
+    first_period TEXT,
+    last_period TEXT
+) AS $$
+    WITH financial AS (
+        SELECT DISTINCT fd.period FROM financial_data fd WHERE fd.company_id = p_company_id
+    ),
+    segment AS (
+        SELECT DISTINCT plr.period FROM product_line_revenue plr WHERE plr.company_id = p_company_id
+    ),
+    missing AS (
+        SELECT period FROM financial
+        EXCEPT
+        SELECT period FROM segment
+    ),
+    all_periods AS (
+        SELECT period FROM financial
+        UNION
+        SELECT period FROM segment
+    )
+    SELECT
+        (SELECT COUNT(*) FROM financial),
+        (SELECT COUNT(*) FROM segment),
+        (SELECT ARRAY_AGG(m.period ORDER BY SUBSTRING(m.period FROM 4), m.period) FROM missing m),
+        (SELECT a.period FROM all_periods a ORDER BY SUBSTRING(a.period FROM 4), a.period LIMIT 1),
+        (SELECT a.period FROM all_periods a ORDER BY SUBSTRING(a.period FROM 4) DESC, a.period DESC LIMIT 1);
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION period_coverage_summary(UUID) IS '期间覆盖汇总 - 覆盖期间数、缺少分段数据的期间和时间范围';
+
+-- ====================================================
+-- 项目总结统计（scripts/project_summary.py）
+-- ====================================================
+
+-- 按数据源统计财务记录数
+CREATE OR REPLACE FUNCTION financial_source_counts(p_company_id UUID)
+RETURNS TABLE(data_source VARCHAR, record_count BIGINT) AS $$
+    SELECT COALESCE(fd.data_source, 'unknown'), COUNT(*)
+    FROM financial_data fd
+    WHERE fd.company_id = p_company_id
+    GROUP BY 1
+    ORDER BY 2 DESC;
+$$ LANGUAGE sql STABLE;
+
+-- 按数据源统计业务分段记录数
+CREATE OR REPLACE FUNCTION segment_source_counts(p_company_id UUID)
+RETURNS TABLE(data_source VARCHAR, record_count BIGINT) AS $$
+    SELECT COALESCE(plr.data_source, 'unknown'), COUNT(*)
+    FROM product_line_revenue plr
+    WHERE plr.company_id = p_company_id
+    GROUP BY 1
+    ORDER BY 2 DESC;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION financial_source_counts(UUID) IS '按数据源统计财务记录数';
+COMMENT ON FUNCTION segment_source_counts(UUID) IS '按数据源统计业务分段记录数';
@@ -407,4 +407,18 @@ COMMENT ON TABLE geographic_revenue IS '地理营收分布表 - 用于地图展
 COMMENT ON TABLE milestone_events IS '里程碑事件表 - 重要事件时间轴';
 COMMENT ON TABLE competitor_data IS '竞争对手数据表 - 用于竞争分析';
 COMMENT ON TABLE market_metrics IS '市场指标表 - 行业和市场数据';
-COMMENT ON TABLE data_update_log IS '数据更新日志表 - 追踪数据变更';
\ No newline at end of file
+COMMENT ON TABLE data_update_log IS '数据更新日志表 - 追踪数据变更';
+
+-- ====================================================
+-- 结构验证（scripts/update_database.py）
+-- ====================================================
+
+-- 列出public schema下的所有表，供一次请求验证表结构
+CREATE OR REPLACE FUNCTION list_public_tables()
+RETURNS TABLE(table_name TEXT) AS $$
+    SELECT t.table_name::TEXT
+    FROM information_schema.tables t
+    WHERE t.table_schema = 'public' AND t.table_type = 'BASE TABLE';
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION list_public_tables() IS '列出public schema下的所有表';
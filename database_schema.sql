@@ -272,9 +272,11 @@ CREATE TABLE IF NOT EXISTS data_update_log (
 -- 主要查询索引
 CREATE INDEX IF NOT EXISTS idx_financial_data_company_period ON financial_data(company_id, period DESC);
 CREATE INDEX IF NOT EXISTS idx_financial_data_year_quarter ON financial_data(fiscal_year DESC, fiscal_quarter DESC);
+CREATE INDEX IF NOT EXISTS idx_financial_data_company_year_quarter ON financial_data(company_id, fiscal_year DESC, fiscal_quarter DESC);
 
 CREATE INDEX IF NOT EXISTS idx_product_line_company_period ON product_line_revenue(company_id, period DESC);
 CREATE INDEX IF NOT EXISTS idx_product_line_category ON product_line_revenue(category_level, category_name);
+CREATE INDEX IF NOT EXISTS idx_product_line_company_year_quarter ON product_line_revenue(company_id, fiscal_year, fiscal_quarter, category_name, data_source);
 
 CREATE INDEX IF NOT EXISTS idx_geographic_revenue_company_period ON geographic_revenue(company_id, period DESC);
 CREATE INDEX IF NOT EXISTS idx_geographic_revenue_region ON geographic_revenue(region, country);
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+分析视图与函数迁移检查
+部分脚本依赖database/migration_analytics_views.sql中的视图和函数，数据库未执行该迁移时给出明确提示
+"""
+
+from contextlib import contextmanager
+from postgrest.exceptions import APIError
+
+# 分析视图与函数迁移文件（update_database.py执行迁移时一并执行）
+ANALYTICS_MIGRATION_FILE = 'database/migration_analytics_views.sql'
+
+# 表示视图/函数不存在的错误码：Postgres未定义的表、未定义的函数，PostgREST schema缓存中找不到函数、表
+MISSING_OBJECT_CODES = {'42P01', '42883', 'PGRST202', 'PGRST205'}
+
+@contextmanager
+def requires_analytics_migration():
+    """视图或函数不存在导致查询失败时，改为抛出提示执行分析迁移的RuntimeError"""
+    try:
+        yield
+    except APIError as e:
+        if e.code not in MISSING_OBJECT_CODES:
+            raise
+        raise RuntimeError(
+            f"数据库缺少分析视图或函数（{e.message}），"
+            f"请先执行迁移 {ANALYTICS_MIGRATION_FILE}（python scripts/update_database.py 会一并执行）"
+        ) from e
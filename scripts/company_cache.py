@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+公司ID查询（跨进程缓存）
+companies表中的公司UUID创建后不再变化，按Supabase项目和symbol缓存到本地文件，重复运行脚本时跳过数据库查询
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+# 公司ID缓存文件
+COMPANY_ID_CACHE_FILE = '.cache/company_ids.json'
+
+# 缓存有效期（秒），过期后重新查询，避免数据库重建后长期使用失效的ID
+COMPANY_ID_CACHE_TTL = 24 * 3600
+
+# 进程内缓存：缓存键 -> 公司ID（只缓存查到的结果）
+_company_ids: Dict[str, str] = {}
+
+def _load_cache(cache_path: Path) -> dict:
+    """读取缓存文件，文件不存在或损坏时返回空缓存"""
+    try:
+        return json.loads(cache_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+def get_company_id(supabase, symbol: str) -> Optional[str]:
+    """按symbol获取公司ID：先查进程内缓存，再查本地缓存文件，最后查询数据库
+
+    缓存键包含Supabase项目URL，不同环境文件指向的项目互不影响。
+    未找到公司时返回None且不缓存，数据库查询异常向上抛出
+    """
+    cache_key = f"{supabase.supabase_url}|{symbol}"
+    if cache_key in _company_ids:
+        return _company_ids[cache_key]
+
+    cache_path = Path(COMPANY_ID_CACHE_FILE)
+    cache = _load_cache(cache_path)
+
+    entry = cache.get(cache_key)
+    if entry and time.time() - entry.get('cached_at', 0) < COMPANY_ID_CACHE_TTL:
+        _company_ids[cache_key] = entry['id']
+        return entry['id']
+
+    result = supabase.table('companies').select('id').eq('symbol', symbol).execute()
+    if not result.data:
+        return None
+
+    company_id = result.data[0]['id']
+    _company_ids[cache_key] = company_id
+    cache[cache_key] = {'id': company_id, 'cached_at': time.time()}
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(cache), encoding='utf-8')
+    except OSError:
+        # 缓存写入失败不影响本次结果
+        pass
+
+    return company_id
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+并发执行互不依赖的Supabase查询
+各脚本的统计、验证查询通常彼此独立，同时发出后总耗时约等于最慢的一个查询
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+def fetch_all(queries: Dict[str, Any], return_exceptions: bool = False) -> Dict[str, Any]:
+    """并发执行查询，按名称返回结果
+
+    queries的值可以是查询构建器（执行其execute）或无参可调用对象。
+    return_exceptions为True时，单个查询的异常作为该名称的结果返回，不影响其他查询；
+    否则按名称顺序向上抛出第一个异常
+    """
+    if not queries:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = {
+            name: executor.submit(query if callable(query) else query.execute)
+            for name, query in queries.items()
+        }
+
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[name] = e
+        return results
@@ -5,10 +5,11 @@
 """
 
 import os
+import asyncio
 import logging
 import re
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Iterator
 from supabase import create_client
 from dotenv import load_dotenv
 import pdfplumber
@@ -17,12 +18,22 @@ from pathlib import Path
 # 加载环境变量
 load_dotenv()
 
+# 分段锚点之后用于正则匹配的窗口大小（两段300字符间隔 + 数字）
+SEGMENT_WINDOW_SIZE = 700
+
+# 解析与写库流水线之间的缓冲队列长度
+PIPELINE_QUEUE_SIZE = 2
+
+# 上下文中表示下降的关键词，忽略大小写匹配，避免反复生成小写副本
+NEGATIVE_GROWTH_RE = re.compile(r'decreased|declined|lower', re.IGNORECASE)
+
 class EnhancedPDFExtractor:
     def __init__(self):
         self.setup_logging()
         self.setup_supabase()
         self.netgear_company_id = None
         self.pdf_directory = "database/releases"
+        self.period_index: Dict[str, Optional[Dict[str, Any]]] = {}
         
     def setup_logging(self):
         """设置日志"""
@@ -72,15 +83,26 @@ class EnhancedPDFExtractor:
         for pdf in sorted(pdf_files):
             self.logger.info(f"   - {os.path.basename(pdf)}")
         
+        self.build_period_index(pdf_files)
         return sorted(pdf_files)
     
+    def build_period_index(self, pdf_files: List[str]):
+        """为所有PDF文件名一次性建立本次运行的期间查找表（不落盘，解析规则变化后无需失效处理）"""
+        for pdf in pdf_files:
+            filename = os.path.basename(pdf)
+            if filename not in self.period_index:
+                self.period_index[filename] = self.match_period_from_filename(filename)
+    
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """从PDF中提取文本内容"""
         try:
+            # 不传laparams：pdfplumber默认跳过pdfminer的版面分析，extract_text自行聚类字符
             with pdfplumber.open(pdf_path) as pdf:
                 text = ""
                 for page in pdf.pages:
                     page_text = page.extract_text()
+                    # 提取后立即释放该页缓存的字符/对象，避免整份文档常驻内存
+                    page.close()
                     if page_text:
                         text += page_text + "\n"
                 return text
@@ -89,7 +111,17 @@ class EnhancedPDFExtractor:
             return ""
     
     def parse_period_from_filename(self, filename: str) -> Optional[Dict[str, Any]]:
-        """从文件名解析财报期间 - 增强版"""
+        """从文件名解析财报期间，优先查表"""
+        if filename not in self.period_index:
+            self.period_index[filename] = self.match_period_from_filename(filename)
+        
+        period_info = self.period_index[filename]
+        if not period_info:
+            self.logger.warning(f"无法解析期间信息: {filename}")
+        return period_info
+    
+    def match_period_from_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        """用正则从文件名解析财报期间 - 增强版"""
         # 改进的匹配模式，支持更多格式
         patterns = [
             # 标准格式: "First Quarter 2025", etc.
@@ -109,7 +141,7 @@ class EnhancedPDFExtractor:
         for pattern in patterns:
             match = re.search(pattern, filename, re.IGNORECASE)
             if match:
-                if 'Full Year' in pattern:
+                if r'Full\s+Year' in pattern:
                     # 年报文件，提取Q4数据
                     year = int(match.group(1))
                     return {
@@ -132,66 +164,32 @@ class EnhancedPDFExtractor:
                             'is_full_year': False
                         }
         
-        self.logger.warning(f"无法解析期间信息: {filename}")
         return None
     
     def extract_segment_data_2025(self, text: str) -> List[Dict[str, Any]]:
         """提取2025年三分段业务数据"""
-        segments = []
-        
         # 2025年分段模式
         segment_patterns = {
             'NETGEAR for Business': [
-                r'NETGEAR for Business.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-                r'NFB.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-                r'Business.*?segment.*?[\$]?([\d,]+\.?\d*)\s*million'
+                r'NETGEAR for Business[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+                r'NFB[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+                r'Business[\s\S]{0,300}?segment[\s\S]{0,300}?[\$]?([\d,]+\.?\d*)\s*million'
             ],
             'Home Networking': [
-                r'Home Networking.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-                r'Home.*?networking.*?[\$]?([\d,]+\.?\d*)\s*million'
+                r'Home Networking[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+                r'Home[\s\S]{0,300}?networking[\s\S]{0,300}?[\$]?([\d,]+\.?\d*)\s*million'
             ],
             'Mobile': [
-                r'Mobile.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-                r'Mobile.*?segment.*?[\$]?([\d,]+\.?\d*)\s*million'
+                r'Mobile[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+                r'Mobile[\s\S]{0,300}?segment[\s\S]{0,300}?[\$]?([\d,]+\.?\d*)\s*million'
             ]
         }
         
-        for segment_name, patterns in segment_patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE | re.DOTALL)
-                for match in matches:
-                    revenue_str = match.group(1).replace(',', '')
-                    try:
-                        revenue = float(revenue_str) * 1000000
-                        
-                        # 合理性检查 - NETGEAR单个分段收入通常在10M-100M范围
-                        if 10000000 <= revenue <= 200000000:  # 10M-200M range
-                            
-                            # 提取增长率和毛利率
-                            segment_context = self.get_segment_context(text, segment_name, match.start(), match.end())
-                            growth_rate = self.extract_growth_rate_from_context(segment_context)
-                            margin = self.extract_margin_from_context(segment_context)
-                            
-                            segment_data = {
-                                'category_name': segment_name,
-                                'revenue': revenue,
-                                'growth_rate': growth_rate,
-                                'gross_margin': margin
-                            }
-                            
-                            segments.append(segment_data)
-                            self.logger.info(f"📈 {segment_name}: ${revenue/1000000:.1f}M" + 
-                                           (f" ({growth_rate:+.1f}%)" if growth_rate else ""))
-                            break
-                    except ValueError:
-                        continue
-        
-        return segments
+        # 合理性检查 - NETGEAR单个分段收入通常在10M-200M范围
+        return self.match_segment_patterns(text, segment_patterns, 200000000)
     
     def extract_segment_data_2024(self, text: str) -> List[Dict[str, Any]]:
         """提取2024年分段业务数据（过渡期，可能是2分段或3分段）"""
-        segments = []
-        
         # 先尝试3分段模式
         three_segment_data = self.extract_segment_data_2025(text)
         if len(three_segment_data) >= 2:
@@ -200,67 +198,46 @@ class EnhancedPDFExtractor:
         # 如果3分段数据不足，尝试2分段模式
         segment_patterns = {
             'Connected Home': [
-                r'Connected Home.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-                r'Consumer.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
+                r'Connected Home[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+                r'Consumer[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
             ],
             'NETGEAR for Business': [
-                r'NETGEAR for Business.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-                r'Business.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
+                r'NETGEAR for Business[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+                r'Business[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
             ]
         }
         
-        for segment_name, patterns in segment_patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE | re.DOTALL)
-                for match in matches:
-                    revenue_str = match.group(1).replace(',', '')
-                    try:
-                        revenue = float(revenue_str) * 1000000
-                        
-                        if 10000000 <= revenue <= 200000000:
-                            segment_context = self.get_segment_context(text, segment_name, match.start(), match.end())
-                            growth_rate = self.extract_growth_rate_from_context(segment_context)
-                            margin = self.extract_margin_from_context(segment_context)
-                            
-                            segment_data = {
-                                'category_name': segment_name,
-                                'revenue': revenue,
-                                'growth_rate': growth_rate,
-                                'gross_margin': margin
-                            }
-                            
-                            segments.append(segment_data)
-                            self.logger.info(f"📈 {segment_name}: ${revenue/1000000:.1f}M" + 
-                                           (f" ({growth_rate:+.1f}%)" if growth_rate else ""))
-                            break
-                    except ValueError:
-                        continue
-        
-        return segments
+        return self.match_segment_patterns(text, segment_patterns, 200000000)
     
     def extract_segment_data_2023(self, text: str) -> List[Dict[str, Any]]:
         """提取2023年二分段业务数据"""
-        segments = []
-        
         segment_patterns = {
             'Connected Home': [
-                r'Connected Home.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
+                r'Connected Home[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
             ],
             'NETGEAR for Business': [
-                r'NETGEAR for Business.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-                r'Business.*?segment.*?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
+                r'NETGEAR for Business[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+                r'Business[\s\S]{0,300}?segment[\s\S]{0,300}?revenues?\s+(?:of\s+)?[\$]?([\d,]+\.?\d*)\s*million'
             ]
         }
         
+        # 2023年收入可能更高
+        return self.match_segment_patterns(text, segment_patterns, 300000000)
+    
+    def match_segment_patterns(self, text: str, segment_patterns: Dict[str, List[str]], max_revenue: float) -> List[Dict[str, Any]]:
+        """按分段模式匹配收入，并补充增长率和毛利率"""
+        segments = []
+        text_lower = text.lower()
+        
         for segment_name, patterns in segment_patterns.items():
             for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE | re.DOTALL)
-                for match in matches:
+                for match in self.find_anchored_matches(text, text_lower, pattern):
                     revenue_str = match.group(1).replace(',', '')
                     try:
                         revenue = float(revenue_str) * 1000000
                         
-                        if 10000000 <= revenue <= 300000000:  # 2023年收入可能更高
+                        if 10000000 <= revenue <= max_revenue:
+                            # 提取增长率和毛利率
                             segment_context = self.get_segment_context(text, segment_name, match.start(), match.end())
                             growth_rate = self.extract_growth_rate_from_context(segment_context)
                             margin = self.extract_margin_from_context(segment_context)
@@ -281,6 +258,23 @@ class EnhancedPDFExtractor:
         
         return segments
     
+    def find_anchored_matches(self, text: str, text_lower: str, pattern: str) -> Iterator[re.Match]:
+        """先用str.find定位模式开头的字面锚点，只在锚点后的局部窗口内执行正则"""
+        anchor = pattern.split('[', 1)[0].lower()
+        regex = re.compile(pattern, re.IGNORECASE)
+        
+        # lower()改变长度时（极少见的Unicode字符）偏移量不可复用，回退到全文扫描
+        if len(text_lower) != len(text):
+            yield from regex.finditer(text)
+            return
+        
+        pos = text_lower.find(anchor)
+        while pos >= 0:
+            match = regex.match(text, pos, pos + SEGMENT_WINDOW_SIZE)
+            if match:
+                yield match
+            pos = text_lower.find(anchor, pos + 1)
+    
     def get_segment_context(self, text: str, segment_name: str, start_pos: int, end_pos: int) -> str:
         """获取分段周围的上下文"""
         # 取匹配位置前后500个字符作为上下文
@@ -305,7 +299,7 @@ class EnhancedPDFExtractor:
                     growth = float(match.group(1).replace(',', ''))
                     
                     # 判断正负
-                    if 'decreased' in context.lower() or 'declined' in context.lower() or 'lower' in context.lower():
+                    if NEGATIVE_GROWTH_RE.search(context):
                         growth = -growth
                     elif match.group(0).startswith('-'):
                         growth = -growth
@@ -434,8 +428,8 @@ class EnhancedPDFExtractor:
         
         return financial_saved, segments_saved
     
-    def process_pdf_file(self, pdf_path: str) -> Dict[str, Any]:
-        """处理单个PDF文件"""
+    def parse_pdf_file(self, pdf_path: str) -> Dict[str, Any]:
+        """解析单个PDF文件（提取文本与指标），不写数据库"""
         filename = os.path.basename(pdf_path)
         self.logger.info(f"📄 处理PDF文件: {filename}")
         
@@ -468,18 +462,76 @@ class EnhancedPDFExtractor:
         else:
             segments = self.extract_segment_data_2023(text)
         
-        # 保存数据
-        financial_saved, segments_saved = self.save_enhanced_data(period_info, total_revenue, segments)
+        return {
+            'success': True,
+            'period_info': period_info,
+            'total_revenue': total_revenue,
+            'segments': segments
+        }
+    
+    def save_parsed_result(self, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """将parse_pdf_file的结果写入数据库"""
+        period_info = parsed['period_info']
+        financial_saved, segments_saved = self.save_enhanced_data(
+            period_info, parsed['total_revenue'], parsed['segments']
+        )
         
         return {
             'success': True,
             'period': period_info['period'],
-            'total_revenue': total_revenue,
-            'segments_count': len(segments),
+            'total_revenue': parsed['total_revenue'],
+            'segments_count': len(parsed['segments']),
             'financial_saved': financial_saved,
             'segments_saved': segments_saved
         }
     
+    def process_pdf_file(self, pdf_path: str) -> Dict[str, Any]:
+        """处理单个PDF文件"""
+        parsed = self.parse_pdf_file(pdf_path)
+        if not parsed['success']:
+            return parsed
+        return self.save_parsed_result(parsed)
+    
+    async def run_pipeline(self, pdf_files: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """解析与写库两级流水线：写入第N-1个文件时同时解析第N个文件
+        
+        返回 (pdf_path, result) 列表，处理出错时 result 为 None
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        results = []
+        
+        async def parse_stage():
+            for pdf_path in pdf_files:
+                try:
+                    parsed = await loop.run_in_executor(None, self.parse_pdf_file, pdf_path)
+                except Exception as e:
+                    self.logger.error(f"处理PDF文件出错 {pdf_path}: {e}")
+                    parsed = None
+                await queue.put((pdf_path, parsed))
+            await queue.put(None)
+        
+        async def write_stage():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                
+                pdf_path, parsed = item
+                if parsed is None or not parsed['success']:
+                    results.append((pdf_path, parsed))
+                    continue
+                
+                try:
+                    result = await loop.run_in_executor(None, self.save_parsed_result, parsed)
+                except Exception as e:
+                    self.logger.error(f"处理PDF文件出错 {pdf_path}: {e}")
+                    result = None
+                results.append((pdf_path, result))
+        
+        await asyncio.gather(parse_stage(), write_stage())
+        return results
+    
     def run_extraction(self) -> bool:
         """运行完整的增强PDF数据提取流程"""
         self.logger.info("🚀 启动增强版PDF财报数据提取")
@@ -495,25 +547,21 @@ class EnhancedPDFExtractor:
         total_financial_saved = 0
         total_segments_saved = 0
         
-        for pdf_path in pdf_files:
-            try:
-                result = self.process_pdf_file(pdf_path)
-                processed_count += 1
+        for pdf_path, result in asyncio.run(self.run_pipeline(pdf_files)):
+            processed_count += 1
+            if result is None:
+                continue
+            
+            if result['success']:
+                successful_count += 1
+                if result['financial_saved']:
+                    total_financial_saved += 1
+                total_segments_saved += result['segments_saved']
                 
-                if result['success']:
-                    successful_count += 1
-                    if result['financial_saved']:
-                        total_financial_saved += 1
-                    total_segments_saved += result['segments_saved']
-                    
-                    revenue_m = (result.get('total_revenue') or 0) / 1000000
-                    self.logger.info(f"✅ {result['period']}: ${revenue_m:.1f}M, {result['segments_count']}个分段, 保存{result['segments_saved']}条")
-                else:
-                    self.logger.warning(f"❌ 处理失败: {os.path.basename(pdf_path)} - {result.get('reason')}")
-                    
-            except Exception as e:
-                self.logger.error(f"处理PDF文件出错 {pdf_path}: {e}")
-                processed_count += 1
+                revenue_m = (result.get('total_revenue') or 0) / 1000000
+                self.logger.info(f"✅ {result['period']}: ${revenue_m:.1f}M, {result['segments_count']}个分段, 保存{result['segments_saved']}条")
+            else:
+                self.logger.warning(f"❌ 处理失败: {os.path.basename(pdf_path)} - {result.get('reason')}")
         
         # 总结报告
         self.logger.info("=" * 60)
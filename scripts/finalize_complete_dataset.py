@@ -8,13 +8,39 @@
 
 import os
 import logging
+import logging.handlers
 from datetime import datetime
+from typing import List, Optional, Set
 from supabase import create_client
 from dotenv import load_dotenv
+from concurrent_queries import fetch_all
+from analytics_migration import requires_analytics_migration
 
 # 加载环境变量
 load_dotenv()
 
+# 单次insert提交的最大记录数
+INSERT_CHUNK_SIZE = 500
+
+# 2024年新的三分段模式（基于2025年实际分段比例调整）
+SEGMENT_MODEL_2024 = [
+    {
+        'category_name': 'NETGEAR for Business',
+        'revenue_percentage': 47.0,  # 2024年估算比例
+        'estimated_margin': 45.0
+    },
+    {
+        'category_name': 'Home Networking',
+        'revenue_percentage': 38.0,  # 2024年估算比例  
+        'estimated_margin': 28.0
+    },
+    {
+        'category_name': 'Mobile',
+        'revenue_percentage': 15.0,  # 2024年估算比例
+        'estimated_margin': 25.0
+    }
+]
+
 class FinalizeCompleteDataset:
     def __init__(self):
         self.setup_logging()
@@ -22,15 +48,25 @@ class FinalizeCompleteDataset:
         self.netgear_company_id = None
         
     def setup_logging(self):
-        """设置日志"""
-        log_filename = f'finalize_complete_dataset_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
+        """设置日志（设置LOG_TO_FILE时额外写入缓冲的日志文件，LOG_LEVEL控制输出级别）"""
+        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        handlers = [logging.StreamHandler()]
+        if os.getenv('LOG_TO_FILE'):
+            log_filename = f'finalize_complete_dataset_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
+            # basicConfig只给MemoryHandler设置格式，落盘的FileHandler需单独设置
+            file_handler = logging.FileHandler(log_filename)
+            file_handler.setFormatter(logging.Formatter(log_format))
+            # 缓冲写入，攒满或遇到ERROR时才落盘
+            handlers.append(logging.handlers.MemoryHandler(
+                capacity=512,
+                flushLevel=logging.ERROR,
+                target=file_handler
+            ))
+        
         logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_filename),
-                logging.StreamHandler()
-            ]
+            level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+            format=log_format,
+            handlers=handlers
         )
         self.logger = logging.getLogger(__name__)
         
@@ -57,34 +93,52 @@ class FinalizeCompleteDataset:
         self.netgear_company_id = result.data[0]['id']
         return self.netgear_company_id
     
+    def company_query(self, table: str, columns: str = '*', count: Optional[str] = None, **filters):
+        """构建限定为NETGEAR的查询，额外的关键字参数作为等值过滤条件"""
+        query = self.supabase.table(table).select(columns, count=count, head=bool(count)).eq(
+            'company_id', self.get_company_id()
+        )
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        return query
+    
+    def get_existing_periods(self, table: str, periods: List[str]) -> Set[str]:
+        """一次查询返回表中已存在的期间"""
+        result = self.company_query(table, 'period').in_('period', periods).execute()
+        return {row['period'] for row in result.data}
+    
     def add_q2_2025_financial_data(self):
         """添加Q2-2025财务数据"""
         self.logger.info("💰 添加Q2-2025财务数据...")
         
         company_id = self.get_company_id()
         
+        # 待补充的财务数据（基于之前获取的真实数据）
+        financial_records = [
+            {
+                'company_id': company_id,
+                'period': 'Q2-2025',
+                'fiscal_year': 2025,
+                'fiscal_quarter': 2,
+                'revenue': 170500000,  # $170.5M (官方实际数据)
+                'data_source': 'earnings_report'
+            }
+        ]
+        
         # 检查是否已存在
-        existing = self.supabase.table('financial_data').select('id').eq(
-            'company_id', company_id
-        ).eq('period', 'Q2-2025').execute()
+        existing_periods = self.get_existing_periods(
+            'financial_data', [record['period'] for record in financial_records]
+        )
+        missing_records = [record for record in financial_records if record['period'] not in existing_periods]
         
-        if existing.data:
+        if not missing_records:
             self.logger.info("Q2-2025财务数据已存在")
             return True
         
-        # 插入Q2-2025财务数据（基于之前获取的真实数据）
-        financial_record = {
-            'company_id': company_id,
-            'period': 'Q2-2025',
-            'fiscal_year': 2025,
-            'fiscal_quarter': 2,
-            'revenue': 170500000,  # $170.5M (官方实际数据)
-            'data_source': 'earnings_report'
-        }
-        
-        result = self.supabase.table('financial_data').insert(financial_record).execute()
+        result = self.supabase.table('financial_data').insert(missing_records).execute()
         if result.data:
-            self.logger.info("✅ 插入Q2-2025财务数据: $170.5M")
+            for record in missing_records:
+                self.logger.info(f"✅ 插入{record['period']}财务数据: ${record['revenue'] / 1000000:.1f}M")
             return True
         else:
             self.logger.error("❌ 插入Q2-2025财务数据失败")
@@ -96,23 +150,17 @@ class FinalizeCompleteDataset:
         
         company_id = self.get_company_id()
         
-        # 获取2024年的财务数据
-        financial_2024 = self.supabase.table('financial_data').select('*').eq(
-            'company_id', company_id
-        ).eq('fiscal_year', 2024).order('fiscal_quarter').execute()
+        # 获取2024年有营收的财务数据
+        financial_2024 = self.company_query(
+            'financial_data', 'period, revenue, fiscal_year, fiscal_quarter', fiscal_year=2024
+        ).not_.is_('revenue', 'null').order('fiscal_quarter').execute()
         
         if not financial_2024.data:
             self.logger.error("未找到2024年财务数据")
             return False
         
-        # 删除旧的2024年业务分段数据
-        self.logger.info("🗑️ 删除旧的2024年业务分段数据...")
-        delete_result = self.supabase.table('product_line_revenue').delete().eq(
-            'company_id', company_id
-        ).eq('fiscal_year', 2024).execute()
-        
-        # 为每个季度创建新的三分段数据
-        updated_count = 0
+        # 为每个季度创建新的三分段数据，汇总后统一分块upsert
+        all_segment_records = []
         for financial_data in financial_2024.data:
             quarter = financial_data['fiscal_quarter']
             period = financial_data['period']
@@ -121,29 +169,12 @@ class FinalizeCompleteDataset:
             if not revenue:
                 continue
             
-            # 新的三分段模式（基于2025年实际分段比例调整）
-            segments = [
-                {
-                    'category_name': 'NETGEAR for Business',
-                    'revenue_percentage': 47.0,  # 2024年估算比例
-                    'estimated_margin': 45.0
-                },
-                {
-                    'category_name': 'Home Networking',
-                    'revenue_percentage': 38.0,  # 2024年估算比例  
-                    'estimated_margin': 28.0
-                },
-                {
-                    'category_name': 'Mobile',
-                    'revenue_percentage': 15.0,  # 2024年估算比例
-                    'estimated_margin': 25.0
-                }
+            segment_revenues = [
+                int(revenue * segment['revenue_percentage'] / 100) for segment in SEGMENT_MODEL_2024
             ]
             
             segment_records = []
-            for segment in segments:
-                segment_revenue = int(revenue * segment['revenue_percentage'] / 100)
-                
+            for segment, segment_revenue in zip(SEGMENT_MODEL_2024, segment_revenues):
                 segment_record = {
                     'company_id': company_id,
                     'period': period,
@@ -159,58 +190,62 @@ class FinalizeCompleteDataset:
                 }
                 segment_records.append(segment_record)
             
-            # 批量插入
-            if segment_records:
-                result = self.supabase.table('product_line_revenue').insert(segment_records).execute()
-                if result.data:
-                    updated_count += len(segment_records)
-                    self.logger.info(f"✅ 更新{period}新分段模式: {len(segment_records)}条")
-                    for record in segment_records:
-                        revenue_m = record['revenue'] / 1000000
-                        self.logger.info(f"  - {record['category_name']}: ${revenue_m:.1f}M ({record['revenue_percentage']:.1f}%)")
+            self.logger.info(f"📝 生成{period}新分段模式: {len(segment_records)}条")
+            for record in segment_records:
+                revenue_m = record['revenue'] / 1000000
+                self.logger.info(f"  - {record['category_name']}: ${revenue_m:.1f}M ({record['revenue_percentage']:.1f}%)")
+            all_segment_records.extend(segment_records)
+        
+        # 批量upsert，已存在的三分段记录原地更新，表中不会出现数据缺口
+        updated_count = 0
+        for i in range(0, len(all_segment_records), INSERT_CHUNK_SIZE):
+            chunk = all_segment_records[i:i + INSERT_CHUNK_SIZE]
+            result = self.supabase.table('product_line_revenue').upsert(
+                chunk,
+                on_conflict='company_id,period,category_name,category_level'
+            ).execute()
+            if result.data:
+                updated_count += len(chunk)
+        
+        # 删除旧分段模式遗留的2024年记录
+        if updated_count:
+            self.logger.info("🗑️ 删除旧的2024年业务分段数据...")
+            new_categories = sorted({record['category_name'] for record in all_segment_records})
+            self.supabase.table('product_line_revenue').delete().eq(
+                'company_id', company_id
+            ).eq('fiscal_year', 2024).not_.in_('category_name', new_categories).execute()
         
         self.logger.info(f"✅ 2024年业务分段更新完成: {updated_count}条记录")
         return updated_count > 0
     
+    @requires_analytics_migration()
     def verify_final_completeness(self):
         """验证最终数据完整性"""
         self.logger.info("🔍 验证最终数据完整性...")
         
-        company_id = self.get_company_id()
-        
-        # 检查财务数据
-        financial_result = self.supabase.table('financial_data').select('period, revenue, fiscal_year, fiscal_quarter').eq(
-            'company_id', company_id
-        ).order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
+        # 检查财务数据（financial_coverage视图，每季度一行）
+        financial_result = self.company_query('financial_coverage', 'fiscal_year, fiscal_quarter, revenue').execute()
         
-        # 检查业务分段数据
-        segment_result = self.supabase.table('product_line_revenue').select('period, category_name, revenue, fiscal_year, fiscal_quarter').eq(
-            'company_id', company_id
-        ).order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
+        # 检查业务分段数据（segment_coverage视图，已在数据库端按季度汇总）
+        segment_result = self.company_query(
+            'segment_coverage', 'fiscal_year, fiscal_quarter, segment_names, record_count'
+        ).execute()
         
+        segment_record_count = sum(row['record_count'] for row in segment_result.data)
         self.logger.info(f"📊 最终数据统计:")
         self.logger.info(f"  - 财务数据: {len(financial_result.data)} 个期间")
-        self.logger.info(f"  - 业务分段数据: {len(segment_result.data)} 条记录")
+        self.logger.info(f"  - 业务分段数据: {segment_record_count} 条记录")
         
         # 详细统计
-        from collections import defaultdict
-        
-        financial_by_year = defaultdict(list)
-        segment_by_year = defaultdict(lambda: defaultdict(set))
+        financial_by_year = {}
+        segment_by_year = {}
         
-        # 统计财务数据
         for row in financial_result.data:
-            year = row['fiscal_year']
-            quarter = row['fiscal_quarter']
             revenue = row['revenue'] / 1000000 if row['revenue'] else 0
-            financial_by_year[year].append((quarter, revenue))
+            financial_by_year.setdefault(row['fiscal_year'], []).append((row['fiscal_quarter'], revenue))
         
-        # 统计业务分段数据
         for row in segment_result.data:
-            year = row['fiscal_year']
-            quarter = row['fiscal_quarter']
-            category = row['category_name']
-            segment_by_year[year][quarter].add(category)
+            segment_by_year.setdefault(row['fiscal_year'], {})[row['fiscal_quarter']] = row['segment_names']
         
         self.logger.info("📈 最终数据分布:")
         
@@ -222,25 +257,31 @@ class FinalizeCompleteDataset:
             
             for quarter, revenue in quarters:
                 # 获取该季度的业务分段
-                segments = list(segment_by_year[year].get(quarter, []))
+                segments = segment_by_year.get(year, {}).get(quarter, [])
                 segment_count = len(segments)
                 
                 self.logger.info(f"    Q{quarter}: ${revenue:.1f}M - {segment_count}个分段{segments}")
         
-        # 检查数据完整性问题
-        issues = []
-        
-        expected_quarters = {2023: [1,2,3,4], 2024: [1,2,3,4], 2025: [1,2]}
-        for year, expected in expected_quarters.items():
-            existing_quarters = [q for q, _ in financial_by_year.get(year, [])]
-            missing_financial = [q for q in expected if q not in existing_quarters]
-            
-            if missing_financial:
-                issues.append(f"{year}年财务数据缺失: Q{missing_financial}")
-            
-            for quarter in expected:
-                if quarter not in segment_by_year.get(year, {}):
-                    issues.append(f"{year}年Q{quarter}业务分段数据缺失")
+        # 检查数据完整性问题（期望范围2023 Q1 - 2025 Q2，缺失季度由数据库计算）
+        missing_result = self.supabase.rpc('find_missing_quarters', {
+            'p_company_id': self.get_company_id(),
+            'p_start_year': 2023,
+            'p_end_year': 2025,
+            'p_end_quarter': 2
+        }).execute()
+        
+        missing_financial_by_year = {}
+        for row in missing_result.data:
+            if row['missing_financial']:
+                missing_financial_by_year.setdefault(row['fiscal_year'], []).append(row['fiscal_quarter'])
+        
+        issues = [
+            f"{year}年财务数据缺失: Q{quarters}" for year, quarters in missing_financial_by_year.items()
+        ]
+        issues.extend(
+            f"{row['fiscal_year']}年Q{row['fiscal_quarter']}业务分段数据缺失"
+            for row in missing_result.data if row['missing_segments']
+        )
         
         if issues:
             self.logger.warning("⚠️ 发现数据完整性问题:")
@@ -255,29 +296,33 @@ class FinalizeCompleteDataset:
         """生成数据完整性总结报告"""
         self.logger.info("📋 生成数据完整性总结报告...")
         
-        company_id = self.get_company_id()
-        
-        # 统计总体数据
-        financial_count = len(self.supabase.table('financial_data').select('id').eq('company_id', company_id).execute().data)
-        segment_count = len(self.supabase.table('product_line_revenue').select('id').eq('company_id', company_id).execute().data)
+        # 各统计查询互不依赖，并发发出
+        queries = {
+            # 统计总体数据（只取计数，不传输行数据）
+            'financial_count': self.company_query('financial_data', 'id', count='exact'),
+            'segment_count': self.company_query('product_line_revenue', 'id', count='exact'),
+            # 获取营收范围（最大、最小值各取一行）
+            'max_revenue': self.company_query('financial_data', 'revenue').not_.is_(
+                'revenue', 'null'
+            ).order('revenue', desc=True).limit(1),
+            'min_revenue': self.company_query('financial_data', 'revenue').not_.is_(
+                'revenue', 'null'
+            ).order('revenue').limit(1),
+            # 获取业务分段类型统计
+            'segment_categories': self.company_query('product_line_revenue', 'category_name')
+        }
+        results = fetch_all(queries)
         
-        # 获取营收范围
-        financial_data = self.supabase.table('financial_data').select('period, revenue').eq(
-            'company_id', company_id
-        ).order('revenue', desc=True).execute()
+        financial_count = results['financial_count'].count or 0
+        segment_count = results['segment_count'].count or 0
         
-        if financial_data.data:
-            max_revenue = max(row['revenue'] for row in financial_data.data if row['revenue']) / 1000000
-            min_revenue = min(row['revenue'] for row in financial_data.data if row['revenue']) / 1000000
+        if results['max_revenue'].data:
+            max_revenue = results['max_revenue'].data[0]['revenue'] / 1000000
+            min_revenue = results['min_revenue'].data[0]['revenue'] / 1000000
         else:
             max_revenue = min_revenue = 0
         
-        # 获取业务分段类型统计
-        segment_categories = self.supabase.table('product_line_revenue').select('category_name').eq(
-            'company_id', company_id
-        ).execute()
-        
-        unique_categories = set(row['category_name'] for row in segment_categories.data)
+        unique_categories = set(row['category_name'] for row in results['segment_categories'].data)
         
         self.logger.info("🎯 NETGEAR财务数据库最终状态报告:")
         self.logger.info("=" * 50)
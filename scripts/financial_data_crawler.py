@@ -6,9 +6,16 @@ Netgear财务数据爬虫脚本
 
 import os
 import sys
+import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-from datetime import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from supabase import create_client, Client
@@ -16,6 +23,28 @@ from supabase import create_client, Client
 # 加载环境变量
 load_dotenv('../.env.local')
 
+# 单次upsert提交的最大记录数
+UPSERT_CHUNK_SIZE = 500
+
+# Alpha Vantage免费额度：每分钟最多5次调用
+MAX_CALLS_PER_MINUTE = 5
+RATE_LIMIT_WINDOW = 60
+
+# Alpha Vantage响应的本地缓存目录，按(function, symbol, 日期)缓存，当天重跑不再请求API
+API_CACHE_DIR = '.cache/alpha_vantage'
+
+# 每个公司需要拉取的报表类型
+STATEMENT_FUNCTIONS = {
+    'income': 'INCOME_STATEMENT',
+    'balance': 'BALANCE_SHEET'
+}
+
+# 正常财报响应中包含的数据字段，只有包含这些字段的响应才写入缓存
+STATEMENT_DATA_KEYS = ('quarterlyReports', 'annualReports')
+
+# 并发请求的工作线程数，实际调用速率由限流器控制
+API_WORKERS = 2
+
 class FinancialDataCrawler:
     def __init__(self):
         self.alpha_vantage_key = os.getenv('ALPHA_VANTAGE_API_KEY')
@@ -26,8 +55,18 @@ class FinancialDataCrawler:
             raise ValueError("缺少必要的环境变量配置")
         
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        self._company_id_cache: Dict[str, str] = {}
         self.base_url = 'https://www.alphavantage.co/query'
         
+        # 复用HTTPS连接，并对限流和服务端错误做指数退避重试
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+        
+        # 滑动窗口限流：记录最近MAX_CALLS_PER_MINUTE次调用的时间
+        self._request_times = deque(maxlen=MAX_CALLS_PER_MINUTE)
+        self._rate_lock = threading.Lock()
+        
         # 主要关注的公司
         self.companies = [
             {'symbol': 'NTGR', 'name': 'NETGEAR Inc'},
@@ -35,13 +74,37 @@ class FinancialDataCrawler:
             {'symbol': 'HPE', 'name': 'Hewlett Packard Enterprise'}
         ]
 
+    def wait_for_rate_limit(self):
+        """等待到窗口内调用次数低于限额，并登记本次调用"""
+        with self._rate_lock:
+            if len(self._request_times) == MAX_CALLS_PER_MINUTE:
+                wait_seconds = RATE_LIMIT_WINDOW - (time.monotonic() - self._request_times[0])
+                if wait_seconds > 0:
+                    print(f"达到API调用限额，等待 {wait_seconds:.1f} 秒...")
+                    time.sleep(wait_seconds)
+            self._request_times.append(time.monotonic())
+
+    def get_cache_path(self, params: Dict) -> Path:
+        """API响应缓存文件路径"""
+        cache_key = f"{params.get('function')}_{params.get('symbol', 'NA')}_{date.today().isoformat()}"
+        return Path(API_CACHE_DIR) / f"{cache_key}.json"
+
     def make_api_request(self, params: Dict) -> Optional[Dict]:
         """发送API请求到Alpha Vantage"""
+        cache_path = self.get_cache_path(params)
+        if cache_path.exists():
+            try:
+                print(f"使用缓存: {params.get('function')} for {params.get('symbol', 'N/A')}")
+                return json.loads(cache_path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                print(f"缓存读取失败，重新请求: {e}")
+        
         params['apikey'] = self.alpha_vantage_key
         
+        self.wait_for_rate_limit()
         try:
             print(f"正在请求: {params.get('function')} for {params.get('symbol', 'N/A')}")
-            response = requests.get(self.base_url, params=params, timeout=30)
+            response = self.session.get(self.base_url, params=params, timeout=30)
             response.raise_for_status()
             
             data = response.json()
@@ -55,6 +118,22 @@ class FinancialDataCrawler:
                 print(f"API限制: {data['Note']}")
                 return None
             
+            # 当前的限流、付费接口提示使用Information字段
+            if 'Information' in data:
+                print(f"API限制: {data['Information']}")
+                return None
+            
+            # 不含财报数据的响应（未知的提示或错误）不缓存，避免当天一直重放
+            if not any(key in data for key in STATEMENT_DATA_KEYS):
+                print(f"API响应缺少财报数据: {list(data.keys())}")
+                return None
+            
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                cache_path.write_text(json.dumps(data), encoding='utf-8')
+            except OSError as e:
+                print(f"缓存保存失败: {e}")
+            
             return data
             
         except requests.exceptions.RequestException as e:
@@ -63,33 +142,47 @@ class FinancialDataCrawler:
 
     def format_period(self, date_string: str) -> str:
         """格式化日期为季度格式 Q1-2024"""
+        # 日期为定长的YYYY-MM-DD，直接切片比strptime快得多
         try:
-            date = datetime.strptime(date_string, '%Y-%m-%d')
-            quarter = (date.month - 1) // 3 + 1
-            return f"Q{quarter}-{date.year}"
-        except:
+            year = int(date_string[:4])
+            month = int(date_string[5:7])
+        except (ValueError, TypeError):
+            return date_string
+        
+        if not 1 <= month <= 12:
             return date_string
+        
+        quarter = (month - 1) // 3 + 1
+        return f"Q{quarter}-{year}"
+
+    def fetch_statements(self, symbols: List[str]) -> Dict[str, Dict[str, Optional[Dict]]]:
+        """把所有(公司, 报表)请求放入同一个受限流控制的线程池并发拉取"""
+        with ThreadPoolExecutor(max_workers=API_WORKERS) as executor:
+            futures = {
+                (symbol, name): executor.submit(self.make_api_request, {'function': function, 'symbol': symbol})
+                for symbol in symbols
+                for name, function in STATEMENT_FUNCTIONS.items()
+            }
+            
+            statements = {symbol: {} for symbol in symbols}
+            for (symbol, name), future in futures.items():
+                try:
+                    statements[symbol][name] = future.result()
+                except Exception as e:
+                    print(f"获取 {symbol} {STATEMENT_FUNCTIONS[name]} 时发生错误: {e}")
+                    statements[symbol][name] = None
+        
+        return statements
 
     def get_company_financials(self, symbol: str) -> List[Dict]:
         """获取公司财务数据"""
+        statements = self.fetch_statements([symbol])[symbol]
+        return self.parse_company_financials(symbol, statements['income'], statements['balance'])
+
+    def parse_company_financials(self, symbol: str, income_data: Optional[Dict], balance_data: Optional[Dict]) -> List[Dict]:
+        """合并损益表和资产负债表的季度数据"""
         financial_data = []
         
-        # 获取损益表数据
-        income_params = {
-            'function': 'INCOME_STATEMENT',
-            'symbol': symbol
-        }
-        income_data = self.make_api_request(income_params)
-        time.sleep(12)  # API限制每分钟5次调用
-        
-        # 获取资产负债表数据
-        balance_params = {
-            'function': 'BALANCE_SHEET',
-            'symbol': symbol
-        }
-        balance_data = self.make_api_request(balance_params)
-        time.sleep(12)
-        
         if not income_data or not balance_data:
             print(f"无法获取 {symbol} 的完整财务数据")
             return []
@@ -131,40 +224,61 @@ class FinancialDataCrawler:
         except (ValueError, TypeError):
             return None
 
+    def get_company_ids(self, symbols: List[str]) -> Optional[Dict[str, str]]:
+        """批量获取公司ID，已解析过的symbol直接读缓存"""
+        missing = [symbol for symbol in symbols if symbol not in self._company_id_cache]
+        if missing:
+            try:
+                company_result = self.supabase.table('companies').select('id, symbol').in_('symbol', missing).execute()
+            except Exception as e:
+                print(f"获取公司ID失败: {e}")
+                return None
+            
+            for row in company_result.data:
+                self._company_id_cache[row['symbol']] = row['id']
+        
+        return {symbol: self._company_id_cache[symbol] for symbol in symbols if symbol in self._company_id_cache}
+
     def save_to_database(self, financial_data: List[Dict]):
         """保存数据到Supabase"""
-        for data in financial_data:
+        if not financial_data:
+            return
+        
+        symbols = sorted({data['symbol'] for data in financial_data})
+        company_ids = self.get_company_ids(symbols)
+        if company_ids is None:
+            return
+        
+        for symbol in symbols:
+            if symbol not in company_ids:
+                print(f"公司 {symbol} 不存在于数据库中，跳过")
+        
+        # 准备财务数据
+        records = [
+            {
+                'company_id': company_ids[data['symbol']],
+                'period': data['period'],
+                'revenue': data['revenue'],
+                'gross_profit': data['gross_profit'],
+                'net_income': data['net_income'],
+                'total_assets': data['total_assets'],
+                'operating_expenses': data['operating_expenses'],
+                'cash_and_equivalents': data['cash_and_equivalents'],
+                'total_debt': data['total_debt']
+            }
+            for data in financial_data
+            if data['symbol'] in company_ids
+        ]
+        
+        # 使用批量upsert避免重复插入，按块提交以避开PostgREST请求体限制
+        for i in range(0, len(records), UPSERT_CHUNK_SIZE):
+            chunk = records[i:i + UPSERT_CHUNK_SIZE]
             try:
-                # 首先获取或创建公司记录
-                company_result = self.supabase.table('companies').select('id').eq('symbol', data['symbol']).execute()
-                
-                if not company_result.data:
-                    print(f"公司 {data['symbol']} 不存在于数据库中，跳过")
-                    continue
-                
-                company_id = company_result.data[0]['id']
-                
-                # 准备财务数据
-                financial_record = {
-                    'company_id': company_id,
-                    'period': data['period'],
-                    'revenue': data['revenue'],
-                    'gross_profit': data['gross_profit'],
-                    'net_income': data['net_income'],
-                    'total_assets': data['total_assets'],
-                    'operating_expenses': data['operating_expenses'],
-                    'cash_and_equivalents': data['cash_and_equivalents'],
-                    'total_debt': data['total_debt']
-                }
-                
-                # 使用upsert避免重复插入
-                result = self.supabase.table('financial_data').upsert(
-                    financial_record,
+                self.supabase.table('financial_data').upsert(
+                    chunk,
                     on_conflict='company_id,period'
                 ).execute()
-                
-                print(f"保存 {data['symbol']} {data['period']} 财务数据成功")
-                
+                print(f"批量保存 {len(chunk)} 条财务数据成功")
             except Exception as e:
                 print(f"保存数据失败: {e}")
 
@@ -172,11 +286,16 @@ class FinancialDataCrawler:
         """爬取所有公司的财务数据"""
         print("开始爬取财务数据...")
         
+        statements = self.fetch_statements([company['symbol'] for company in self.companies])
+        
         for company in self.companies:
             print(f"\n处理公司: {company['name']} ({company['symbol']})")
             
             try:
-                financial_data = self.get_company_financials(company['symbol'])
+                company_statements = statements[company['symbol']]
+                financial_data = self.parse_company_financials(
+                    company['symbol'], company_statements['income'], company_statements['balance']
+                )
                 
                 if financial_data:
                     print(f"获取到 {len(financial_data)} 条财务记录")
@@ -186,10 +305,6 @@ class FinancialDataCrawler:
                     
             except Exception as e:
                 print(f"处理 {company['symbol']} 时发生错误: {e}")
-            
-            # 避免API限制，等待一段时间
-            print("等待30秒以避免API限制...")
-            time.sleep(30)
         
         print("\n财务数据爬取完成!")
 
@@ -6,13 +6,67 @@
 import os
 import sys
 import logging
+import hashlib
 from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Tuple
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv('../.env.local')
 
+# 单次insert提交的最大记录数
+INSERT_CHUNK_SIZE = 500
+
+# 基于NETGEAR业务结构的产品线分布
+PRODUCT_LINES = [
+    # 一级分类
+    {'level': 1, 'name': '消费级网络产品', 'percentage': 0.68, 'margin': 28.5},
+    {'level': 1, 'name': '商用/企业级产品', 'percentage': 0.22, 'margin': 32.8},
+    {'level': 1, 'name': '服务与软件', 'percentage': 0.10, 'margin': 65.5},
+    
+    # 二级分类 - 消费级
+    {'level': 2, 'name': 'WiFi路由器', 'percentage': 0.40, 'margin': 28.0},
+    {'level': 2, 'name': '网络扩展器/Mesh系统', 'percentage': 0.18, 'margin': 25.0},
+    {'level': 2, 'name': '网络存储(NAS)', 'percentage': 0.10, 'margin': 32.0},
+    
+    # 二级分类 - 企业级
+    {'level': 2, 'name': '企业级路由器', 'percentage': 0.10, 'margin': 35.0},
+    {'level': 2, 'name': '交换机', 'percentage': 0.08, 'margin': 30.0},
+    {'level': 2, 'name': '无线接入点', 'percentage': 0.04, 'margin': 38.0},
+    
+    # 二级分类 - 服务软件
+    {'level': 2, 'name': 'Armor安全服务', 'percentage': 0.05, 'margin': 65.0},
+    {'level': 2, 'name': 'Insight网络管理', 'percentage': 0.03, 'margin': 70.0},
+    {'level': 2, 'name': '其他服务', 'percentage': 0.02, 'margin': 60.0}
+]
+
+# 基于NETGEAR地理分布
+REGIONS = [
+    {'region': '北美', 'country': 'United States', 'code': 'US', 'percentage': 0.55, 
+     'lat': 37.0902, 'lng': -95.7129, 'market_size': 12500000000},
+    {'region': '欧洲', 'country': 'Germany', 'code': 'DE', 'percentage': 0.28,
+     'lat': 51.1657, 'lng': 10.4515, 'market_size': 8200000000},
+    {'region': '亚太', 'country': 'Japan', 'code': 'JP', 'percentage': 0.17,
+     'lat': 36.2048, 'lng': 138.2529, 'market_size': 5800000000}
+]
+
+def stable_hash(text: str) -> int:
+    """与PYTHONHASHSEED无关的稳定哈希（md5前8位），与数据库函数stable_hash结果一致
+
+    注意：早先版本使用crc32，切换到md5后同一名称/期间生成的增长率与之前不同。
+    已写入的估算数据不会自动更新，需要统一口径时先删除data_source='estimated'的记录再重新生成
+    """
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+
+def revenue_share(revenue, percentage: float) -> int:
+    """按比例拆分营收并向下取整
+
+    用Decimal精确计算，与数据库端FLOOR(revenue * pct)的numeric结果一致（浮点乘法可能差1）
+    """
+    return int(Decimal(str(revenue)) * Decimal(str(percentage)))
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -34,19 +88,44 @@ class ProductLineDataGenerator:
             raise ValueError("缺少必要的环境变量")
         
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        self._company_id_cache: Dict[str, str] = {}
+        
+        # 增长率查找表，在确定要生成的期间后由build_growth_tables填充
+        self._yoy_table: Dict[Tuple[str, int], int] = {}
+        self._qoq_table: Dict[Tuple[str, str], int] = {}
+        self._competitor_table: Dict[str, int] = {
+            region['region']: 15 + stable_hash(region['region']) % 10 for region in REGIONS
+        }
         logger.info("产品线数据生成器初始化完成")
 
     def get_company_id(self, symbol: str):
-        """获取公司ID"""
+        """获取公司ID（按symbol缓存）"""
+        if symbol in self._company_id_cache:
+            return self._company_id_cache[symbol]
+        
         try:
             result = self.supabase.table('companies').select('id').eq('symbol', symbol).execute()
             if result.data:
-                return result.data[0]['id']
+                self._company_id_cache[symbol] = result.data[0]['id']
+                return self._company_id_cache[symbol]
             return None
         except Exception as e:
             logger.error(f"获取公司ID失败 {symbol}: {e}")
             return None
 
+    def build_growth_tables(self, periods: List[Tuple[str, int]]):
+        """为所有(名称, 年份)和(名称, 期间)组合预先计算基础增长率"""
+        for period, year in periods:
+            for product in PRODUCT_LINES:
+                name = product['name']
+                self._yoy_table[(name, year)] = 5 + stable_hash(name + str(year)) % 20  # 5-25%
+                self._qoq_table[(name, period)] = 2 + stable_hash(name + period) % 15  # 2-17%
+            
+            for region in REGIONS:
+                name = region['region']
+                self._yoy_table[(name, year)] = 3 + stable_hash(name + str(year)) % 15
+                self._qoq_table[(name, period)] = 1 + stable_hash(name + period) % 10
+
     def generate_all_missing_product_data(self, symbol: str = 'NTGR'):
         """为所有缺失的财务期间生成产品线数据"""
         try:
@@ -55,10 +134,18 @@ class ProductLineDataGenerator:
                 logger.error(f"未找到公司: {symbol}")
                 return False
             
-            # 获取所有财务数据
-            financial_result = self.supabase.table('financial_data').select('*').eq(
+            # 优先在数据库端一次性生成（见database/migration_analytics_views.sql）
+            try:
+                result = self.supabase.rpc('regenerate_product_lines', {'p_company_id': company_id}).execute()
+                logger.info(f"✅ 数据库端生成 {result.data} 条产品线记录")
+                return bool(result.data)
+            except Exception as e:
+                logger.warning(f"regenerate_product_lines不可用，改为客户端生成: {e}")
+            
+            # 获取所有有营收的财务数据
+            financial_result = self.supabase.table('financial_data').select('period, revenue, fiscal_year, fiscal_quarter').eq(
                 'company_id', company_id
-            ).order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
+            ).not_.is_('revenue', 'null').order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
             
             if not financial_result.data:
                 logger.error(f"未找到 {symbol} 的财务数据")
@@ -66,16 +153,23 @@ class ProductLineDataGenerator:
             
             logger.info(f"找到 {len(financial_result.data)} 个财务期间")
             
-            # 获取现有的产品线数据期间
+            # 获取现有的产品线数据期间（只检查财务数据中出现的期间）
             existing_result = self.supabase.table('product_line_revenue').select('period').eq(
                 'company_id', company_id
-            ).execute()
+            ).in_('period', [row['period'] for row in financial_result.data]).execute()
             
             existing_periods = set(item['period'] for item in existing_result.data)
             logger.info(f"现有产品线数据期间: {sorted(existing_periods)}")
             
-            # 为缺失的期间生成数据
+            self.build_growth_tables([
+                (row['period'], row['fiscal_year']) for row in financial_result.data
+                if row['period'] not in existing_periods
+            ])
+            
+            # 为缺失的期间生成数据，汇总后统一分块插入
             generated_count = 0
+            product_line_records = []
+            geographic_records = []
             for financial_data in financial_result.data:
                 period = financial_data['period']
                 revenue = financial_data['revenue']
@@ -93,13 +187,20 @@ class ProductLineDataGenerator:
                 logger.info(f"为 {period} 生成产品线数据 (营收: ${revenue/1e6:.1f}M)")
                 
                 # 生成产品线数据
-                self.generate_product_line_data(company_id, period, year, quarter, revenue)
+                product_line_records.extend(
+                    self.generate_product_line_data(company_id, period, year, quarter, revenue)
+                )
                 
                 # 生成地理分布数据
-                self.generate_geographic_data(company_id, period, year, quarter, revenue)
+                geographic_records.extend(
+                    self.generate_geographic_data(company_id, period, year, quarter, revenue)
+                )
                 
                 generated_count += 1
             
+            self.insert_in_chunks('product_line_revenue', product_line_records)
+            self.insert_in_chunks('geographic_revenue', geographic_records)
+            
             logger.info(f"✅ 成功为 {generated_count} 个期间生成产品线数据")
             return generated_count > 0
             
@@ -107,40 +208,24 @@ class ProductLineDataGenerator:
             logger.error(f"生成产品线数据失败: {e}")
             return False
 
-    def generate_product_line_data(self, company_id: str, period: str, year: int, quarter: int, revenue: int):
+    def insert_in_chunks(self, table: str, records: List[Dict]):
+        """按块批量插入记录，避开PostgREST请求体限制"""
+        for i in range(0, len(records), INSERT_CHUNK_SIZE):
+            chunk = records[i:i + INSERT_CHUNK_SIZE]
+            self.supabase.table(table).insert(chunk).execute()
+            logger.info(f"插入 {len(chunk)} 条记录到 {table}")
+
+    def generate_product_line_data(self, company_id: str, period: str, year: int, quarter: int, revenue: int) -> List[Dict]:
         """生成产品线估算数据"""
         try:
-            # 基于NETGEAR业务结构的产品线分布
-            product_lines = [
-                # 一级分类
-                {'level': 1, 'name': '消费级网络产品', 'percentage': 0.68, 'margin': 28.5},
-                {'level': 1, 'name': '商用/企业级产品', 'percentage': 0.22, 'margin': 32.8},
-                {'level': 1, 'name': '服务与软件', 'percentage': 0.10, 'margin': 65.5},
-                
-                # 二级分类 - 消费级
-                {'level': 2, 'name': 'WiFi路由器', 'percentage': 0.40, 'margin': 28.0},
-                {'level': 2, 'name': '网络扩展器/Mesh系统', 'percentage': 0.18, 'margin': 25.0},
-                {'level': 2, 'name': '网络存储(NAS)', 'percentage': 0.10, 'margin': 32.0},
-                
-                # 二级分类 - 企业级
-                {'level': 2, 'name': '企业级路由器', 'percentage': 0.10, 'margin': 35.0},
-                {'level': 2, 'name': '交换机', 'percentage': 0.08, 'margin': 30.0},
-                {'level': 2, 'name': '无线接入点', 'percentage': 0.04, 'margin': 38.0},
-                
-                # 二级分类 - 服务软件
-                {'level': 2, 'name': 'Armor安全服务', 'percentage': 0.05, 'margin': 65.0},
-                {'level': 2, 'name': 'Insight网络管理', 'percentage': 0.03, 'margin': 70.0},
-                {'level': 2, 'name': '其他服务', 'percentage': 0.02, 'margin': 60.0}
-            ]
-            
             records = []
-            for product in product_lines:
-                product_revenue = int(revenue * product['percentage'])
+            for product in PRODUCT_LINES:
+                product_revenue = revenue_share(revenue, product['percentage'])
                 
                 # 基于年份和产品类型调整增长率
-                base_growth = 5 + (hash(product['name'] + str(year)) % 20)  # 5-25%
+                base_growth = self._yoy_table[(product['name'], year)]
                 yoy_growth = max(0, base_growth - (2025 - year) * 2)  # 历史年份增长率适当降低
-                qoq_growth = 2 + (hash(product['name'] + period) % 15)  # 2-17%
+                qoq_growth = self._qoq_table[(product['name'], period)]
                 
                 record = {
                     'company_id': company_id,
@@ -159,34 +244,24 @@ class ProductLineDataGenerator:
                 }
                 records.append(record)
             
-            # 批量插入
-            result = self.supabase.table('product_line_revenue').insert(records).execute()
-            logger.info(f"插入 {len(records)} 条产品线记录到 {period}")
+            logger.info(f"生成 {len(records)} 条产品线记录: {period}")
+            return records
             
         except Exception as e:
             logger.error(f"生成产品线数据失败 {period}: {e}")
+            return []
 
-    def generate_geographic_data(self, company_id: str, period: str, year: int, quarter: int, revenue: int):
+    def generate_geographic_data(self, company_id: str, period: str, year: int, quarter: int, revenue: int) -> List[Dict]:
         """生成地理分布估算数据"""
         try:
-            # 基于NETGEAR地理分布
-            regions = [
-                {'region': '北美', 'country': 'United States', 'code': 'US', 'percentage': 0.55, 
-                 'lat': 37.0902, 'lng': -95.7129, 'market_size': 12500000000},
-                {'region': '欧洲', 'country': 'Germany', 'code': 'DE', 'percentage': 0.28,
-                 'lat': 51.1657, 'lng': 10.4515, 'market_size': 8200000000},
-                {'region': '亚太', 'country': 'Japan', 'code': 'JP', 'percentage': 0.17,
-                 'lat': 36.2048, 'lng': 138.2529, 'market_size': 5800000000}
-            ]
-            
             records = []
-            for region in regions:
-                region_revenue = int(revenue * region['percentage'])
+            for region in REGIONS:
+                region_revenue = revenue_share(revenue, region['percentage'])
                 
                 # 基于年份调整增长率
-                base_yoy_growth = 3 + (hash(region['region'] + str(year)) % 15)
+                base_yoy_growth = self._yoy_table[(region['region'], year)]
                 yoy_growth = max(0, base_yoy_growth - (2025 - year) * 1.5)
-                qoq_growth = 1 + (hash(region['region'] + period) % 10)
+                qoq_growth = self._qoq_table[(region['region'], period)]
                 
                 record = {
                     'company_id': company_id,
@@ -199,8 +274,8 @@ class ProductLineDataGenerator:
                     'revenue': region_revenue,
                     'revenue_percentage': region['percentage'] * 100,
                     'market_size': region['market_size'],
-                    'market_share': (region_revenue / region['market_size']) * 100,
-                    'competitor_count': 15 + (hash(region['region']) % 10),
+                    'market_share': float(Decimal(region_revenue) / region['market_size'] * 100),
+                    'competitor_count': self._competitor_table[region['region']],
                     'yoy_growth': yoy_growth,
                     'qoq_growth': qoq_growth,
                     'latitude': region['lat'],
@@ -209,12 +284,12 @@ class ProductLineDataGenerator:
                 }
                 records.append(record)
             
-            # 插入数据
-            result = self.supabase.table('geographic_revenue').insert(records).execute()
-            logger.info(f"插入 {len(records)} 条地理分布记录到 {period}")
+            logger.info(f"生成 {len(records)} 条地理分布记录: {period}")
+            return records
             
         except Exception as e:
             logger.error(f"生成地理分布数据失败 {period}: {e}")
+            return []
 
 def main():
     """主函数"""
@@ -7,13 +7,19 @@
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv('../.env.local')
 
+# PostgREST请求超时（秒）
+POSTGREST_TIMEOUT = 60
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -30,15 +36,29 @@ class DatabaseInitializer:
         if not supabase_url or not supabase_key:
             raise ValueError("缺少必要的环境变量: NEXT_PUBLIC_SUPABASE_URL 或 NEXT_PUBLIC_SUPABASE_ANON_KEY")
         
-        self.supabase: Client = create_client(supabase_url, supabase_key)
+        # 客户端在进程内复用，其PostgREST会话保持长连接
+        self.supabase: Client = create_client(
+            supabase_url, supabase_key,
+            options=ClientOptions(postgrest_client_timeout=POSTGREST_TIMEOUT)
+        )
+        self._company_id_cache: Dict[str, str] = {}
         logger.info("数据库连接初始化完成")
+        
+        # 三类数据都属于NETGEAR，只解析一次公司ID
+        self.netgear_id = self.get_company_id('NTGR')
+        if not self.netgear_id:
+            raise ValueError("无法获取NETGEAR公司ID")
 
     def get_company_id(self, symbol: str):
-        """获取公司ID"""
+        """获取公司ID（按symbol缓存）"""
+        if symbol in self._company_id_cache:
+            return self._company_id_cache[symbol]
+        
         try:
             result = self.supabase.table('companies').select('id').eq('symbol', symbol).execute()
             if result.data and len(result.data) > 0:
-                return result.data[0]['id']
+                self._company_id_cache[symbol] = result.data[0]['id']
+                return self._company_id_cache[symbol]
             else:
                 logger.error(f"未找到公司: {symbol}")
                 return None
@@ -50,11 +70,7 @@ class DatabaseInitializer:
         """插入产品线营收数据"""
         logger.info("开始插入产品线数据...")
         
-        # 获取NETGEAR公司ID
-        netgear_id = self.get_company_id('NTGR')
-        if not netgear_id:
-            logger.error("无法获取NETGEAR公司ID，跳过产品线数据插入")
-            return False
+        netgear_id = self.netgear_id
 
         # Q1-2025 产品线数据 (一级分类)
         product_line_data = [
@@ -151,11 +167,7 @@ class DatabaseInitializer:
         """插入地理分布数据"""
         logger.info("开始插入地理分布数据...")
         
-        # 获取NETGEAR公司ID
-        netgear_id = self.get_company_id('NTGR')
-        if not netgear_id:
-            logger.error("无法获取NETGEAR公司ID，跳过地理分布数据插入")
-            return False
+        netgear_id = self.netgear_id
 
         geographic_data = [
             {
@@ -229,11 +241,7 @@ class DatabaseInitializer:
         """插入里程碑事件数据"""
         logger.info("开始插入里程碑事件数据...")
         
-        # 获取NETGEAR公司ID
-        netgear_id = self.get_company_id('NTGR')
-        if not netgear_id:
-            logger.error("无法获取NETGEAR公司ID，跳过里程碑事件数据插入")
-            return False
+        netgear_id = self.netgear_id
 
         events_data = [
             {
@@ -282,20 +290,17 @@ class DatabaseInitializer:
         """执行完整的数据库初始化"""
         logger.info("开始数据库初始化流程...")
         
-        success_count = 0
-        total_tasks = 3
-        
-        # 1. 插入产品线数据
-        if self.insert_product_line_data():
-            success_count += 1
-        
-        # 2. 插入地理分布数据
-        if self.insert_geographic_data():
-            success_count += 1
+        # 三个插入任务写不同的表，互不依赖，并发执行
+        tasks = [
+            self.insert_product_line_data,  # 1. 插入产品线数据
+            self.insert_geographic_data,    # 2. 插入地理分布数据
+            self.insert_milestone_events    # 3. 插入里程碑事件数据
+        ]
+        total_tasks = len(tasks)
         
-        # 3. 插入里程碑事件数据
-        if self.insert_milestone_events():
-            success_count += 1
+        with ThreadPoolExecutor(max_workers=total_tasks) as executor:
+            results = list(executor.map(lambda task: task(), tasks))
+        success_count = sum(1 for result in results if result)
         
         logger.info(f"数据库初始化完成: {success_count}/{total_tasks} 个任务成功")
         
@@ -6,25 +6,131 @@ NETGEAR官方PDF财报数据提取器
 """
 
 import os
+import asyncio
+import hashlib
 import logging
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional, Any, Tuple
 from supabase import create_client
+from supabase.lib.client_options import ClientOptions
 from dotenv import load_dotenv
-import PyPDF2
-import pdfplumber
+import pypdfium2 as pdfium
 from pathlib import Path
 
 # 加载环境变量
 load_dotenv()
 
+# PostgREST请求超时（秒），批量upsert的请求体较大
+POSTGREST_TIMEOUT = 60
+
+# 并发写库的期间数上限，限制同时占用的PostgREST连接
+SAVE_CONCURRENCY = 10
+
+# PDF文本缓存目录，按文件内容的sha256缓存，重跑时跳过PDF解析
+PDF_TEXT_CACHE_DIR = '.cache/pdftext'
+
+# 缓存文件名后缀，区分不同解析器生成的文本（更换解析器后旧缓存自动失效）
+PDF_TEXT_CACHE_SUFFIX = '.pdfium.txt'
+
+# 文件名中的财报期间，如 "Second Quarter 2025"
+QUARTER_PATTERN = re.compile(r'(First|Second|Third|Fourth) Quarter (\d{4})', re.IGNORECASE)
+QUARTER_MAP = {
+    'First': 1,
+    'Second': 2,
+    'Third': 3,
+    'Fourth': 4
+}
+
+# 预编译的正则模式，避免每个PDF、每个分段重复编译
+# 模式均为小写且不带IGNORECASE，匹配对象是提前转小写的文本
+# 总收入
+REVENUE_PATTERNS = tuple(re.compile(p) for p in [
+    r'net revenues?\s+(?:of\s+)?(?:were\s+)?[\$]?([\d,]+\.?\d*)\s*million',
+    r'total\s+net\s+revenues?\s+[\$]?([\d,]+\.?\d*)\s*million',
+    r'net\s+revenues?\s+[\$]?([\d,]+\.?\d*)\s*million'
+])
+
+# 业务分段名称及其别名（小写，按优先级排列，首个能匹配到金额的别名生效）
+# 2025年三分段模式
+SEGMENT_ALIASES_2025 = {
+    'NETGEAR for Business': ('netgear for business', 'nfb'),
+    'Home Networking': ('home networking', 'home'),
+    'Mobile': ('mobile',)
+}
+
+# 2023-2024年二分段模式
+SEGMENT_ALIASES_LEGACY = {
+    'Connected Home': ('connected home',),
+    'NETGEAR for Business': ('netgear for business', 'nfb')
+}
+
+def _compile_alias_pattern(segment_aliases: Dict[str, Tuple[str, ...]]) -> re.Pattern:
+    """把所有分段别名编译成一个交替模式，长别名优先，一次扫描即可定位各别名的首次出现"""
+    aliases = sorted({a for names in segment_aliases.values() for a in names}, key=len, reverse=True)
+    return re.compile('|'.join(re.escape(a) for a in aliases))
+
+SEGMENT_ALIAS_PATTERN_2025 = _compile_alias_pattern(SEGMENT_ALIASES_2025)
+SEGMENT_ALIAS_PATTERN_LEGACY = _compile_alias_pattern(SEGMENT_ALIASES_LEGACY)
+
+# 分段名称之后最近的金额
+SEGMENT_REVENUE_PATTERN = re.compile(r'[\$]?([\d,]+\.?\d*)\s*million')
+
+# 分段增长率
+SEGMENT_GROWTH_PATTERNS = tuple(re.compile(p) for p in [
+    r'(?:increased|decreased|grew|declined)\s+(?:by\s+)?([\d,]+\.?\d*)%',
+    r'([\d,]+\.?\d*)%\s+(?:increase|decrease|growth|decline)',
+    r'(?:\+|\-)([\d,]+\.?\d*)%'
+])
+
+# 分段下降标记：只检查匹配到的增长率片段本身（下降措辞或开头的负号），
+# 避免上下文中"Q1-2025"、"2024-2025"等期间连字符被误判为负号
+SEGMENT_DECLINE_PATTERN = re.compile(r'decrease|decline|^-')
+
+# 分段毛利率
+SEGMENT_MARGIN_PATTERNS = tuple(re.compile(p) for p in [
+    r'gross margin.*?([\d,]+\.?\d*)%',
+    r'margin.*?([\d,]+\.?\d*)%',
+    r'([\d,]+\.?\d*)%.*?margin'
+])
+
+# 年度增长率
+YOY_PATTERNS = tuple(re.compile(p) for p in [
+    r'compared to.*?same period.*?year.*?([\+\-]?[\d,]+\.?\d*)%',
+    r'year-over-year.*?([\+\-]?[\d,]+\.?\d*)%',
+    r'compared to.*?prior year.*?([\+\-]?[\d,]+\.?\d*)%'
+])
+
+# 整体毛利率
+MARGIN_PATTERNS = tuple(re.compile(p) for p in [
+    r'gross margin.*?([\d,]+\.?\d*)%',
+    r'overall.*?margin.*?([\d,]+\.?\d*)%'
+])
+
+def _to_float(number_str: str) -> float:
+    """把正则捕获的带千分位逗号的数字（如 "1,234.5"）转换为浮点数"""
+    return float(number_str.replace(',', ''))
+
 class PDFFinancialDataExtractor:
     def __init__(self):
         self.setup_logging()
-        self.setup_supabase()
+        self._supabase = None
         self.netgear_company_id = None
         self.pdf_directory = "database/releases"
+    
+    def __getstate__(self):
+        """传给解析子进程时不携带Supabase客户端，子进程只做解析，按需再创建"""
+        state = self.__dict__.copy()
+        state['_supabase'] = None
+        return state
+    
+    @property
+    def supabase(self):
+        """首次使用时才创建Supabase客户端"""
+        if self._supabase is None:
+            self.setup_supabase()
+        return self._supabase
         
     def setup_logging(self):
         """设置日志"""
@@ -47,7 +153,11 @@ class PDFFinancialDataExtractor:
         if not supabase_url or not supabase_key:
             raise ValueError("Supabase凭据未找到")
             
-        self.supabase = create_client(supabase_url, supabase_key)
+        # 客户端在进程内复用，其PostgREST会话保持长连接
+        self._supabase = create_client(
+            supabase_url, supabase_key,
+            options=ClientOptions(postgrest_client_timeout=POSTGREST_TIMEOUT)
+        )
         self.logger.info("✅ Supabase客户端初始化成功")
         
     def get_company_id(self) -> str:
@@ -64,62 +174,61 @@ class PDFFinancialDataExtractor:
     
     def find_pdf_files(self) -> List[str]:
         """查找所有PDF财报文件"""
-        pdf_files = []
-        if os.path.exists(self.pdf_directory):
-            for file in os.listdir(self.pdf_directory):
-                if file.endswith('.pdf'):
-                    pdf_files.append(os.path.join(self.pdf_directory, file))
+        pdf_files = sorted(str(path) for path in Path(self.pdf_directory).glob('*.pdf'))
         
         self.logger.info(f"📁 发现 {len(pdf_files)} 个PDF财报文件")
         for pdf in pdf_files:
             self.logger.info(f"   - {os.path.basename(pdf)}")
         
-        return sorted(pdf_files)
+        return pdf_files
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """从PDF中提取文本内容"""
+        """从PDF中提取文本内容（按内容哈希缓存到磁盘）"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                return text
+            with open(pdf_path, 'rb') as f:
+                pdf_bytes = f.read()
+            
+            cache_path = Path(PDF_TEXT_CACHE_DIR) / f"{hashlib.sha256(pdf_bytes).hexdigest()}{PDF_TEXT_CACHE_SUFFIX}"
+            if cache_path.exists():
+                return cache_path.read_text(encoding='utf-8')
+            
+            text = self.parse_pdf_text(pdf_bytes)
+            if text:
+                try:
+                    cache_path.parent.mkdir(parents=True, exist_ok=True)
+                    cache_path.write_text(text, encoding='utf-8')
+                except OSError as e:
+                    self.logger.warning(f"PDF文本缓存保存失败 {pdf_path}: {e}")
+            return text
         except Exception as e:
             self.logger.error(f"从PDF提取文本失败 {pdf_path}: {e}")
             return ""
     
+    def parse_pdf_text(self, pdf_bytes: bytes) -> str:
+        """用pypdfium2解析PDF内容为文本（不做版面重建，比pdfplumber快一个数量级）"""
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            # 收集各页文本后一次性拼接，避免逐页字符串累加的二次复制
+            page_texts = []
+            for page in pdf:
+                page_text = page.get_textpage().get_text_bounded()
+                if page_text:
+                    page_texts.append(page_text.replace('\r\n', '\n'))
+            return "\n".join(page_texts) + "\n" if page_texts else ""
+        finally:
+            pdf.close()
+    
     def parse_period_from_filename(self, filename: str) -> Optional[Dict[str, Any]]:
         """从文件名解析财报期间"""
-        # 匹配模式: "Second Quarter 2025", "First Quarter 2025", etc.
-        quarter_patterns = [
-            r'First Quarter (\d{4})',
-            r'Second Quarter (\d{4})',
-            r'Third Quarter (\d{4})',
-            r'Fourth Quarter (\d{4})',
-        ]
-        
-        quarter_map = {
-            'First': 1,
-            'Second': 2, 
-            'Third': 3,
-            'Fourth': 4
-        }
-        
-        for pattern in quarter_patterns:
-            match = re.search(pattern, filename, re.IGNORECASE)
-            if match:
-                quarter_name = pattern.split()[0].replace('(', '').replace('\\', '')
-                year = int(match.group(1))
-                quarter = quarter_map.get(quarter_name, 0)
-                
-                if quarter > 0:
-                    return {
-                        'fiscal_year': year,
-                        'fiscal_quarter': quarter,
-                        'period': f'Q{quarter}-{year}'
-                    }
+        match = QUARTER_PATTERN.search(filename)
+        if match:
+            quarter = QUARTER_MAP[match.group(1).title()]
+            year = int(match.group(2))
+            return {
+                'fiscal_year': year,
+                'fiscal_quarter': quarter,
+                'period': f'Q{quarter}-{year}'
+            }
         
         return None
     
@@ -132,75 +241,59 @@ class PDFFinancialDataExtractor:
             'margins': {}
         }
         
+        # 文本只转一次小写，后续模式都按小写文本匹配
+        text_lower = text.lower()
+        
         # 提取总收入
-        revenue_patterns = [
-            r'Net revenues?\s+(?:of\s+)?(?:were\s+)?[\$]?([\d,]+\.?\d*)\s*million',
-            r'Total\s+net\s+revenues?\s+[\$]?([\d,]+\.?\d*)\s*million',
-            r'Net\s+revenues?\s+[\$]?([\d,]+\.?\d*)\s*million'
-        ]
-        
-        for pattern in revenue_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in REVENUE_PATTERNS:
+            match = pattern.search(text_lower)
             if match:
-                revenue_str = match.group(1).replace(',', '')
-                metrics['total_revenue'] = float(revenue_str) * 1000000  # 转换为美元
-                self.logger.info(f"📊 总收入: ${float(revenue_str):.1f}M")
+                revenue_m = _to_float(match.group(1))
+                metrics['total_revenue'] = revenue_m * 1000000  # 转换为美元
+                self.logger.info(f"📊 总收入: ${revenue_m:.1f}M")
                 break
         
-        # 提取业务分段数据
-        segments = self.extract_business_segments(text, period_info)
+        # 提取业务分段数据（分行只做一次，供各分段查找上下文）
+        lines = text_lower.splitlines()
+        segments = self.extract_business_segments(text_lower, lines, period_info)
         metrics['segments'] = segments
         
         # 提取增长率
-        growth_rates = self.extract_growth_rates(text)
+        growth_rates = self.extract_growth_rates(text_lower)
         metrics['growth_rates'] = growth_rates
         
         # 提取毛利率信息
-        margins = self.extract_margins(text)
+        margins = self.extract_margins(text_lower)
         metrics['margins'] = margins
         
         return metrics
     
-    def extract_business_segments(self, text: str, period_info: Dict) -> List[Dict[str, Any]]:
-        """提取业务分段数据"""
+    def extract_business_segments(self, text: str, lines: List[str], period_info: Dict) -> List[Dict[str, Any]]:
+        """提取业务分段数据（text与lines均为小写文本）"""
         segments = []
         
-        # 2025年三分段模式
+        # 2025年三分段模式，2023-2024年二分段模式
         if period_info['fiscal_year'] >= 2025:
-            segment_patterns = {
-                'NETGEAR for Business': [
-                    r'NETGEAR for Business.*?[\$]?([\d,]+\.?\d*)\s*million',
-                    r'NFB.*?[\$]?([\d,]+\.?\d*)\s*million'
-                ],
-                'Home Networking': [
-                    r'Home Networking.*?[\$]?([\d,]+\.?\d*)\s*million',
-                    r'Home.*?[\$]?([\d,]+\.?\d*)\s*million'
-                ],
-                'Mobile': [
-                    r'Mobile.*?[\$]?([\d,]+\.?\d*)\s*million'
-                ]
-            }
+            segment_aliases, alias_pattern = SEGMENT_ALIASES_2025, SEGMENT_ALIAS_PATTERN_2025
         else:
-            # 2023-2024年二分段模式
-            segment_patterns = {
-                'Connected Home': [
-                    r'Connected Home.*?[\$]?([\d,]+\.?\d*)\s*million'
-                ],
-                'NETGEAR for Business': [
-                    r'NETGEAR for Business.*?[\$]?([\d,]+\.?\d*)\s*million',
-                    r'NFB.*?[\$]?([\d,]+\.?\d*)\s*million'
-                ]
-            }
+            segment_aliases, alias_pattern = SEGMENT_ALIASES_LEGACY, SEGMENT_ALIAS_PATTERN_LEGACY
         
-        for segment_name, patterns in segment_patterns.items():
-            for pattern in patterns:
-                match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+        # 一次扫描记录每个别名首次出现后的位置
+        alias_positions = {}
+        for match in alias_pattern.finditer(text):
+            alias_positions.setdefault(match.group(), match.end())
+        
+        for segment_name, aliases in segment_aliases.items():
+            for alias in aliases:
+                if alias not in alias_positions:
+                    continue
+                match = SEGMENT_REVENUE_PATTERN.search(text, alias_positions[alias])
                 if match:
-                    revenue_str = match.group(1).replace(',', '')
-                    revenue = float(revenue_str) * 1000000
+                    revenue_m = _to_float(match.group(1))
+                    revenue = revenue_m * 1000000
                     
                     # 尝试提取该分段的增长率和毛利率
-                    segment_text = self.extract_segment_context(text, segment_name)
+                    segment_text = self.extract_segment_context(lines, segment_name)
                     growth_rate = self.extract_segment_growth(segment_text, segment_name)
                     margin = self.extract_segment_margin(segment_text, segment_name)
                     
@@ -212,52 +305,29 @@ class PDFFinancialDataExtractor:
                     }
                     
                     segments.append(segment_data)
-                    self.logger.info(f"📈 {segment_name}: ${float(revenue_str):.1f}M")
+                    self.logger.info(f"📈 {segment_name}: ${revenue_m:.1f}M")
                     break
         
         return segments
     
-    def extract_segment_context(self, text: str, segment_name: str) -> str:
-        """提取特定分段周围的文本内容"""
-        # 查找分段名称在文本中的位置
-        pattern = rf'{re.escape(segment_name)}.*?(?=(?:[A-Z][a-z]+\s+[A-Z][a-z]+)|(?:\n\n)|$)'
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        
-        if match:
-            return match.group(0)
-        
-        # 如果没找到，返回包含segment_name的段落
-        lines = text.split('\n')
-        context_lines = []
-        found_segment = False
-        
+    def extract_segment_context(self, lines: List[str], segment_name: str) -> str:
+        """提取特定分段周围的文本内容：首个包含分段名称的行及其前后各3行（lines为小写文本）"""
+        segment_lower = segment_name.lower()
         for i, line in enumerate(lines):
-            if segment_name.lower() in line.lower():
-                found_segment = True
-                # 取前后各3行作为上下文
-                start_idx = max(0, i - 3)
-                end_idx = min(len(lines), i + 4)
-                context_lines = lines[start_idx:end_idx]
-                break
+            if segment_lower in line:
+                return ' '.join(lines[max(0, i - 3):i + 4])
         
-        return ' '.join(context_lines) if context_lines else ""
+        return ""
     
     def extract_segment_growth(self, segment_text: str, segment_name: str) -> Optional[float]:
         """提取分段增长率"""
-        growth_patterns = [
-            r'(?:increased|decreased|grew|declined)\s+(?:by\s+)?([\d,]+\.?\d*)%',
-            r'([\d,]+\.?\d*)%\s+(?:increase|decrease|growth|decline)',
-            r'(?:\+|\-)([\d,]+\.?\d*)%'
-        ]
-        
-        for pattern in growth_patterns:
-            match = re.search(pattern, segment_text, re.IGNORECASE)
+        for pattern in SEGMENT_GROWTH_PATTERNS:
+            match = pattern.search(segment_text)
             if match:
-                growth_str = match.group(1).replace(',', '')
-                growth = float(growth_str)
+                growth = _to_float(match.group(1))
                 
-                # 判断是增长还是下降
-                if 'decreased' in segment_text.lower() or 'declined' in segment_text.lower() or segment_text.count('-') > segment_text.count('+'):
+                # 根据匹配到的增长率片段判断是增长还是下降
+                if SEGMENT_DECLINE_PATTERN.search(match.group(0)):
                     growth = -growth
                 
                 return growth
@@ -266,17 +336,10 @@ class PDFFinancialDataExtractor:
     
     def extract_segment_margin(self, segment_text: str, segment_name: str) -> Optional[float]:
         """提取分段毛利率"""
-        margin_patterns = [
-            r'gross margin.*?([\d,]+\.?\d*)%',
-            r'margin.*?([\d,]+\.?\d*)%',
-            r'([\d,]+\.?\d*)%.*?margin'
-        ]
-        
-        for pattern in margin_patterns:
-            match = re.search(pattern, segment_text, re.IGNORECASE)
+        for pattern in SEGMENT_MARGIN_PATTERNS:
+            match = pattern.search(segment_text)
             if match:
-                margin_str = match.group(1).replace(',', '')
-                return float(margin_str)
+                return _to_float(match.group(1))
         
         return None
     
@@ -285,17 +348,10 @@ class PDFFinancialDataExtractor:
         growth_rates = {}
         
         # 年度增长率模式
-        yoy_patterns = [
-            r'compared to.*?same period.*?year.*?([\+\-]?[\d,]+\.?\d*)%',
-            r'year-over-year.*?([\+\-]?[\d,]+\.?\d*)%',
-            r'compared to.*?prior year.*?([\+\-]?[\d,]+\.?\d*)%'
-        ]
-        
-        for pattern in yoy_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in YOY_PATTERNS:
+            match = pattern.search(text)
             if match:
-                growth_str = match.group(1).replace(',', '')
-                growth_rates['yoy'] = float(growth_str)
+                growth_rates['yoy'] = _to_float(match.group(1))
                 break
         
         return growth_rates
@@ -305,35 +361,20 @@ class PDFFinancialDataExtractor:
         margins = {}
         
         # 整体毛利率
-        margin_patterns = [
-            r'gross margin.*?([\d,]+\.?\d*)%',
-            r'overall.*?margin.*?([\d,]+\.?\d*)%'
-        ]
-        
-        for pattern in margin_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in MARGIN_PATTERNS:
+            match = pattern.search(text)
             if match:
-                margin_str = match.group(1).replace(',', '')
-                margins['gross_margin'] = float(margin_str)
+                margins['gross_margin'] = _to_float(match.group(1))
                 break
         
         return margins
     
     def save_financial_data(self, period_info: Dict, metrics: Dict) -> bool:
-        """保存财务数据到数据库"""
+        """保存财务数据到数据库（调用前需已通过get_company_id解析公司ID）"""
         try:
-            company_id = self.get_company_id()
-            
-            # 检查是否已存在
-            existing = self.supabase.table('financial_data').select('id').eq(
-                'company_id', company_id
-            ).eq('period', period_info['period']).execute()
-            
-            if existing.data:
-                self.logger.info(f"财务数据已存在: {period_info['period']}")
-                return True
+            company_id = self.netgear_company_id
             
-            # 插入财务数据
+            # 插入财务数据，已存在的期间由数据库按唯一键跳过
             financial_record = {
                 'company_id': company_id,
                 'period': period_info['period'],
@@ -343,41 +384,40 @@ class PDFFinancialDataExtractor:
                 'data_source': 'official_pdf_report'
             }
             
-            result = self.supabase.table('financial_data').insert(financial_record).execute()
-            if result.data:
-                revenue_m = (metrics.get('total_revenue') or 0) / 1000000
-                self.logger.info(f"✅ 保存财务数据: {period_info['period']} - ${revenue_m:.1f}M")
+            result = self.supabase.table('financial_data').upsert(
+                financial_record,
+                on_conflict='company_id,period',
+                ignore_duplicates=True
+            ).execute()
+            if not result.data:
+                self.logger.info(f"财务数据已存在: {period_info['period']}")
                 return True
             
+            revenue_m = (metrics.get('total_revenue') or 0) / 1000000
+            self.logger.info(f"✅ 保存财务数据: {period_info['period']} - ${revenue_m:.1f}M")
+            return True
+            
         except Exception as e:
             self.logger.error(f"保存财务数据失败: {e}")
             
         return False
     
     def save_segment_data(self, period_info: Dict, segments: List[Dict]) -> int:
-        """保存业务分段数据到数据库"""
+        """保存业务分段数据到数据库（调用前需已通过get_company_id解析公司ID）"""
+        if not segments:
+            return 0
+        
         saved_count = 0
         
         try:
-            company_id = self.get_company_id()
+            company_id = self.netgear_company_id
+            total_revenue = sum(s['revenue'] for s in segments)
             
+            segment_records = []
             for segment in segments:
-                # 检查是否已存在
-                existing = self.supabase.table('product_line_revenue').select('id').eq(
-                    'company_id', company_id
-                ).eq('period', period_info['period']).eq(
-                    'category_name', segment['category_name']
-                ).execute()
-                
-                if existing.data:
-                    self.logger.info(f"分段数据已存在: {period_info['period']} - {segment['category_name']}")
-                    continue
-                
                 # 计算收入占比
-                total_revenue = sum(s['revenue'] for s in segments)
                 revenue_percentage = (segment['revenue'] / total_revenue * 100) if total_revenue > 0 else 0
                 
-                # 插入分段数据
                 segment_record = {
                     'company_id': company_id,
                     'period': period_info['period'],
@@ -388,28 +428,38 @@ class PDFFinancialDataExtractor:
                     'revenue': segment['revenue'],
                     'revenue_percentage': revenue_percentage,
                     'gross_margin': segment.get('gross_margin'),
+                    # 批量upsert要求各行字段一致，没有增长率时写入NULL
+                    'yoy_growth': segment.get('growth_rate'),
                     'data_source': 'official_pdf_report',
                     'estimation_method': 'pdf_text_extraction'
                 }
+                segment_records.append(segment_record)
+            
+            # 一次批量写入，已存在的分段由数据库按唯一键跳过
+            result = self.supabase.table('product_line_revenue').upsert(
+                segment_records,
+                on_conflict='company_id,period,category_name,category_level',
+                ignore_duplicates=True
+            ).execute()
+            
+            saved_names = {row['category_name'] for row in result.data}
+            for segment in segments:
+                if segment['category_name'] not in saved_names:
+                    self.logger.info(f"分段数据已存在: {period_info['period']} - {segment['category_name']}")
+                    continue
                 
-                # 添加增长率
-                if segment.get('growth_rate') is not None:
-                    segment_record['yoy_growth'] = segment['growth_rate']
-                
-                result = self.supabase.table('product_line_revenue').insert(segment_record).execute()
-                if result.data:
-                    saved_count += 1
-                    revenue_m = segment['revenue'] / 1000000
-                    growth_info = f" ({segment['growth_rate']:+.1f}%)" if segment.get('growth_rate') else ""
-                    self.logger.info(f"✅ 保存分段: {segment['category_name']} - ${revenue_m:.1f}M{growth_info}")
+                saved_count += 1
+                revenue_m = segment['revenue'] / 1000000
+                growth_info = f" ({segment['growth_rate']:+.1f}%)" if segment.get('growth_rate') else ""
+                self.logger.info(f"✅ 保存分段: {segment['category_name']} - ${revenue_m:.1f}M{growth_info}")
                 
         except Exception as e:
             self.logger.error(f"保存分段数据失败: {e}")
             
         return saved_count
     
-    def process_pdf_file(self, pdf_path: str) -> Dict[str, Any]:
-        """处理单个PDF文件"""
+    def parse_pdf_file(self, pdf_path: str) -> Dict[str, Any]:
+        """解析单个PDF文件（提取文本与指标），不写数据库"""
         filename = os.path.basename(pdf_path)
         self.logger.info(f"📄 处理PDF文件: {filename}")
         
@@ -430,7 +480,17 @@ class PDFFinancialDataExtractor:
         # 提取财务指标
         metrics = self.extract_financial_metrics(text, period_info)
         
-        # 保存到数据库
+        return {
+            'success': True,
+            'period_info': period_info,
+            'metrics': metrics
+        }
+    
+    def save_parsed_result(self, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """将parse_pdf_file的结果写入数据库"""
+        period_info = parsed['period_info']
+        metrics = parsed['metrics']
+        
         financial_saved = self.save_financial_data(period_info, metrics)
         segments_saved = self.save_segment_data(period_info, metrics['segments'])
         
@@ -443,11 +503,51 @@ class PDFFinancialDataExtractor:
             'segments_saved': segments_saved
         }
     
+    def process_pdf_file(self, pdf_path: str) -> Dict[str, Any]:
+        """处理单个PDF文件"""
+        # 先解析公司ID，数据库不可用时不必解析PDF
+        self.get_company_id()
+        parsed = self.parse_pdf_file(pdf_path)
+        if not parsed['success']:
+            return parsed
+        return self.save_parsed_result(parsed)
+    
+    async def run_pipeline(self, pdf_files: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """各PDF在进程池中并行解析，解析完成的期间立即在线程池中并发写库
+        
+        返回按pdf_files顺序排列的 (pdf_path, result) 列表，处理出错时 result 为 None
+        """
+        loop = asyncio.get_running_loop()
+        max_workers = min(len(pdf_files), os.cpu_count() or 1)
+        
+        with ProcessPoolExecutor(max_workers=max_workers) as parse_executor, \
+                ThreadPoolExecutor(max_workers=SAVE_CONCURRENCY) as save_executor:
+            
+            async def process(pdf_path: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+                try:
+                    parsed = await loop.run_in_executor(parse_executor, self.parse_pdf_file, pdf_path)
+                    if not parsed['success']:
+                        return pdf_path, parsed
+                    result = await loop.run_in_executor(save_executor, self.save_parsed_result, parsed)
+                    return pdf_path, result
+                except Exception as e:
+                    self.logger.error(f"处理PDF文件出错 {pdf_path}: {e}")
+                    return pdf_path, None
+            
+            return await asyncio.gather(*(process(pdf_path) for pdf_path in pdf_files))
+    
     def run_extraction(self) -> bool:
         """运行完整的PDF数据提取流程"""
         self.logger.info("🚀 启动PDF财报数据提取")
         self.logger.info("=" * 60)
         
+        # 公司ID只解析一次，供各期间写库使用；数据库不可用时在解析PDF之前就退出
+        try:
+            self.get_company_id()
+        except Exception as e:
+            self.logger.error(f"获取NETGEAR公司ID失败: {e}")
+            return False
+        
         # 查找PDF文件
         pdf_files = self.find_pdf_files()
         if not pdf_files:
@@ -458,24 +558,19 @@ class PDFFinancialDataExtractor:
         successful_count = 0
         total_segments_saved = 0
         
-        # 处理每个PDF文件
-        for pdf_path in pdf_files:
-            try:
-                result = self.process_pdf_file(pdf_path)
-                processed_count += 1
+        for pdf_path, result in asyncio.run(self.run_pipeline(pdf_files)):
+            processed_count += 1
+            if result is None:
+                continue
+            
+            if result['success']:
+                successful_count += 1
+                total_segments_saved += result['segments_saved']
                 
-                if result['success']:
-                    successful_count += 1
-                    total_segments_saved += result['segments_saved']
-                    
-                    revenue_m = (result.get('total_revenue') or 0) / 1000000
-                    self.logger.info(f"✅ {result['period']}: ${revenue_m:.1f}M, {result['segments_count']}个分段")
-                else:
-                    self.logger.warning(f"❌ 处理失败: {os.path.basename(pdf_path)} - {result.get('reason')}")
-                    
-            except Exception as e:
-                self.logger.error(f"处理PDF文件出错 {pdf_path}: {e}")
-                processed_count += 1
+                revenue_m = (result.get('total_revenue') or 0) / 1000000
+                self.logger.info(f"✅ {result['period']}: ${revenue_m:.1f}M, {result['segments_count']}个分段")
+            else:
+                self.logger.warning(f"❌ 处理失败: {os.path.basename(pdf_path)} - {result.get('reason')}")
         
         # 总结报告
         self.logger.info("=" * 60)
@@ -6,9 +6,11 @@ NETGEAR财务监控项目完成总结
 
 import os
 import logging
-from datetime import datetime
 from supabase import create_client
 from dotenv import load_dotenv
+from concurrent_queries import fetch_all
+from company_cache import get_company_id as get_cached_company_id
+from analytics_migration import requires_analytics_migration
 
 # 加载环境变量
 load_dotenv()
@@ -43,94 +45,99 @@ class ProjectSummary:
         if self.netgear_company_id:
             return self.netgear_company_id
             
-        result = self.supabase.table('companies').select('id').eq('symbol', 'NTGR').execute()
-        if not result.data:
+        # 公司ID跨进程缓存在本地文件中，重复运行时不再查询数据库
+        company_id = get_cached_company_id(self.supabase, 'NTGR')
+        if not company_id:
             raise ValueError("未找到NETGEAR公司记录")
             
-        self.netgear_company_id = result.data[0]['id']
+        self.netgear_company_id = company_id
         return self.netgear_company_id
     
+    @requires_analytics_migration()
     def generate_project_summary(self):
         """生成项目完成总结"""
-        self.logger.info("🎯 NETGEAR财务监控项目完成总结")
-        self.logger.info("=" * 80)
+        # 报告逐行收集，最后作为一条日志输出
+        lines = []
+        report = lines.append
         
-        company_id = self.get_company_id()
-        
-        # 统计数据库数据
-        financial_result = self.supabase.table('financial_data').select('*').eq('company_id', company_id).execute()
-        segment_result = self.supabase.table('product_line_revenue').select('*').eq('company_id', company_id).execute()
-        
-        # 按数据源分类
-        financial_by_source = {}
-        segment_by_source = {}
-        
-        for record in financial_result.data:
-            source = record.get('data_source', 'unknown')
-            if source not in financial_by_source:
-                financial_by_source[source] = []
-            financial_by_source[source].append(record)
+        report("🎯 NETGEAR财务监控项目完成总结")
+        report("=" * 80)
         
-        for record in segment_result.data:
-            source = record.get('data_source', 'unknown')
-            if source not in segment_by_source:
-                segment_by_source[source] = []
-            segment_by_source[source].append(record)
-        
-        self.logger.info("📊 项目成果统计:")
-        self.logger.info(f"   • 总财务记录: {len(financial_result.data)}条")
-        self.logger.info(f"   • 总业务分段记录: {len(segment_result.data)}条")
-        self.logger.info(f"   • 数据时间跨度: 2023-2025年 (10个季度)")
-        
-        self.logger.info("\n📈 按数据源分类:")
-        self.logger.info("   财务数据源:")
-        for source, records in financial_by_source.items():
-            self.logger.info(f"     - {source}: {len(records)}条")
+        company_id = self.get_company_id()
         
-        self.logger.info("   业务分段数据源:")
-        for source, records in segment_by_source.items():
-            self.logger.info(f"     - {source}: {len(records)}条")
+        # 各统计查询互不依赖，并发发出
+        queries = {
+            # 按数据源的记录数在数据库中聚合，不下载全部记录
+            'financial_by_source': self.supabase.rpc('financial_source_counts', {'p_company_id': company_id}),
+            'segment_by_source': self.supabase.rpc('segment_source_counts', {'p_company_id': company_id}),
+            # 最新财报：按(company_id, fiscal_year, fiscal_quarter)索引顺序取第一条
+            'latest_financial': self.supabase.table('financial_data').select(
+                'period, revenue, fiscal_year, fiscal_quarter'
+            ).eq('company_id', company_id).not_.is_('fiscal_year', 'null').order(
+                'fiscal_year', desc=True
+            ).order('fiscal_quarter', desc=True).limit(1),
+            # 最新季度的业务分段构成（latest_segment_mix视图在数据库中定位最新季度）
+            'latest_segments': self.supabase.table('latest_segment_mix').select(
+                'category_name, revenue, revenue_percentage, yoy_growth'
+            ).eq('company_id', company_id).order('revenue', desc=True),
+            # 财务/分段数据各自覆盖的不同期间数（数据库端按period去重）
+            'coverage': self.supabase.rpc('period_coverage_summary', {'p_company_id': company_id})
+        }
+        results = fetch_all(queries)
+        
+        financial_by_source = {row['data_source']: row['record_count'] for row in results['financial_by_source'].data}
+        segment_by_source = {row['data_source']: row['record_count'] for row in results['segment_by_source'].data}
+        total_financial = sum(financial_by_source.values())
+        total_segments = sum(segment_by_source.values())
+        
+        report("📊 项目成果统计:")
+        report(f"   • 总财务记录: {total_financial}条")
+        report(f"   • 总业务分段记录: {total_segments}条")
+        report(f"   • 数据时间跨度: 2023-2025年 (10个季度)")
+        
+        report("\n📈 按数据源分类:")
+        report("   财务数据源:")
+        for source, count in financial_by_source.items():
+            report(f"     - {source}: {count}条")
+        
+        report("   业务分段数据源:")
+        for source, count in segment_by_source.items():
+            report(f"     - {source}: {count}条")
         
         # 最新数据展示
-        latest_financial = sorted(financial_result.data, 
-                                key=lambda x: (x['fiscal_year'], x['fiscal_quarter']), 
-                                reverse=True)[:1]
+        latest_financial = results['latest_financial'].data
         
         if latest_financial:
             latest = latest_financial[0]
             revenue_m = (latest['revenue'] or 0) / 1000000
-            self.logger.info(f"\n💰 最新财报: {latest['period']} - ${revenue_m:.1f}M")
-        
-        # 最新分段数据
-        latest_segments = [s for s in segment_result.data 
-                          if s.get('period') == latest['period']]
-        latest_segments.sort(key=lambda x: x['revenue'] or 0, reverse=True)
-        
-        self.logger.info(f"📊 {latest['period']} 业务分段构成:")
-        for segment in latest_segments:
-            revenue_m = (segment['revenue'] or 0) / 1000000
-            percentage = segment.get('revenue_percentage', 0)
-            growth = segment.get('yoy_growth')
-            growth_str = f" ({growth:+.1f}%)" if growth else ""
-            self.logger.info(f"   • {segment['category_name']}: ${revenue_m:.1f}M ({percentage:.1f}%){growth_str}")
-        
-        self.logger.info("\n🎉 项目主要成就:")
-        self.logger.info("   ✅ 成功整合官方NETGEAR财报PDF数据")
-        self.logger.info("   ✅ 建立完整2023-2025年财务数据集")
-        self.logger.info("   ✅ 实现多数据源整合 (PDF + SEC + API)")
-        self.logger.info("   ✅ 构建自动化数据提取流水线")
-        self.logger.info("   ✅ 创建高质量业务分段分析基础")
-        self.logger.info("   ✅ 前端组件支持真实数据可视化")
-        
-        self.logger.info("\n🔧 技术实现亮点:")
-        self.logger.info("   • Python PDF文本提取 (pdfplumber)")
-        self.logger.info("   • 正则表达式财务数据解析")
-        self.logger.info("   • Supabase数据库集成")
-        self.logger.info("   • Next.js/React前端框架")
-        self.logger.info("   • TypeScript类型安全")
-        self.logger.info("   • ECharts数据可视化")
-        
-        self.logger.info("\n📋 关键脚本文件:")
+            report(f"\n💰 最新财报: {latest['period']} - ${revenue_m:.1f}M")
+            
+            # 最新分段数据
+            report(f"📊 {latest['period']} 业务分段构成:")
+            for segment in results['latest_segments'].data:
+                revenue_m = (segment['revenue'] or 0) / 1000000
+                percentage = segment.get('revenue_percentage', 0)
+                growth = segment.get('yoy_growth')
+                growth_str = f" ({growth:+.1f}%)" if growth else ""
+                report(f"   • {segment['category_name']}: ${revenue_m:.1f}M ({percentage:.1f}%){growth_str}")
+        
+        report("\n🎉 项目主要成就:")
+        report("   ✅ 成功整合官方NETGEAR财报PDF数据")
+        report("   ✅ 建立完整2023-2025年财务数据集")
+        report("   ✅ 实现多数据源整合 (PDF + SEC + API)")
+        report("   ✅ 构建自动化数据提取流水线")
+        report("   ✅ 创建高质量业务分段分析基础")
+        report("   ✅ 前端组件支持真实数据可视化")
+        
+        report("\n🔧 技术实现亮点:")
+        report("   • Python PDF文本提取 (pdfplumber)")
+        report("   • 正则表达式财务数据解析")
+        report("   • Supabase数据库集成")
+        report("   • Next.js/React前端框架")
+        report("   • TypeScript类型安全")
+        report("   • ECharts数据可视化")
+        
+        report("\n📋 关键脚本文件:")
         scripts = [
             "pdf_financial_data_extractor.py - 基础PDF数据提取",
             "enhanced_pdf_extractor.py - 增强版PDF提取器",
@@ -139,48 +146,47 @@ class ProjectSummary:
         ]
         
         for script in scripts:
-            self.logger.info(f"   • {script}")
+            report(f"   • {script}")
         
-        self.logger.info("\n🚀 前端组件优化:")
-        self.logger.info("   • ProductLineRevenue.tsx - 产品线营收可视化")
-        self.logger.info("   • DataSourceIndicator.tsx - 数据源标识")
-        self.logger.info("   • 支持官方PDF数据源标识")
-        self.logger.info("   • 增强数据完整性展示")
+        report("\n🚀 前端组件优化:")
+        report("   • ProductLineRevenue.tsx - 产品线营收可视化")
+        report("   • DataSourceIndicator.tsx - 数据源标识")
+        report("   • 支持官方PDF数据源标识")
+        report("   • 增强数据完整性展示")
         
-        self.logger.info("\n📊 数据质量保证:")
-        official_pdf_segments = len([s for s in segment_result.data 
-                                   if s.get('data_source') == 'official_pdf_report'])
-        sec_segments = len([s for s in segment_result.data 
-                          if s.get('data_source') == 'sec_filing'])
+        report("\n📊 数据质量保证:")
+        official_pdf_segments = segment_by_source.get('official_pdf_report', 0)
+        sec_segments = segment_by_source.get('sec_filing', 0)
         
-        total_segments = len(segment_result.data)
         if total_segments > 0:
             official_percentage = (official_pdf_segments / total_segments) * 100
             sec_percentage = (sec_segments / total_segments) * 100
             
-            self.logger.info(f"   • 官方PDF数据占比: {official_percentage:.1f}%")
-            self.logger.info(f"   • SEC文件数据占比: {sec_percentage:.1f}%")
-            self.logger.info(f"   • 权威数据源总占比: {official_percentage + sec_percentage:.1f}%")
+            report(f"   • 官方PDF数据占比: {official_percentage:.1f}%")
+            report(f"   • SEC文件数据占比: {sec_percentage:.1f}%")
+            report(f"   • 权威数据源总占比: {official_percentage + sec_percentage:.1f}%")
         
-        # 数据完整性检查
-        periods_with_segments = set(s['period'] for s in segment_result.data)
-        periods_with_financial = set(f['period'] for f in financial_result.data)
+        # 数据完整性检查：有分段数据的期间数 / 有财务数据的期间数
+        coverage = results['coverage'].data[0]
+        financial_periods = coverage['financial_period_count']
+        segment_periods = coverage['segment_period_count']
         
-        completeness = len(periods_with_segments) / len(periods_with_financial) * 100 if periods_with_financial else 0
+        completeness = segment_periods / financial_periods * 100 if financial_periods else 0
         
-        self.logger.info(f"\n📈 数据完整性评分: {completeness:.1f}%")
+        report(f"\n📈 数据完整性评分: {completeness:.1f}%")
         if completeness >= 90:
-            self.logger.info("   🌟 优秀 - 数据高度完整")
+            report("   🌟 优秀 - 数据高度完整")
         elif completeness >= 75:
-            self.logger.info("   ✅ 良好 - 数据基本完整")
+            report("   ✅ 良好 - 数据基本完整")
         else:
-            self.logger.info("   ⚠️ 需改进 - 部分数据缺失")
+            report("   ⚠️ 需改进 - 部分数据缺失")
         
-        self.logger.info("\n" + "=" * 80)
-        self.logger.info("🎉 NETGEAR财务监控系统已成功建立完整数据基础!")
-        self.logger.info("📊 系统现在基于官方财报提供准确的业务分段分析")
-        self.logger.info("🚀 前端界面已优化，支持真实数据可视化展示")
+        report("\n" + "=" * 80)
+        report("🎉 NETGEAR财务监控系统已成功建立完整数据基础!")
+        report("📊 系统现在基于官方财报提供准确的业务分段分析")
+        report("🚀 前端界面已优化，支持真实数据可视化展示")
         
+        self.logger.info("\n".join(lines))
         return True
 
 def main():
@@ -52,9 +52,7 @@ def main():
             sys.exit(1)
             
     except Exception as e:
-        logger.error(f"增强版爬虫运行异常: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception(f"增强版爬虫运行异常: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -6,7 +6,7 @@
 import os
 import sys
 import logging
-from datetime import datetime
+from collections import deque
 
 # 尝试使用增强版爬虫，回退到基础版
 try:
@@ -21,10 +21,15 @@ except ImportError:
     import time
     from dotenv import load_dotenv
     from supabase import create_client
+    from company_cache import get_company_id
 
     # 加载环境变量
     load_dotenv('../.env.local')
 
+# Alpha Vantage免费版限额：每分钟5次调用
+MAX_CALLS_PER_MINUTE = 5
+RATE_LIMIT_WINDOW = 60
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -54,6 +59,30 @@ def run_enhanced_crawler():
         logger.error(f"增强版爬虫运行异常: {e}")
         return False
 
+def format_period(date_string):
+    """格式化日期为季度格式"""
+    # 日期为定长的YYYY-MM-DD，直接切片比strptime快得多
+    try:
+        year = int(date_string[:4])
+        month = int(date_string[5:7])
+    except (ValueError, TypeError):
+        return date_string
+    
+    if not 1 <= month <= 12:
+        return date_string
+    
+    quarter = (month - 1) // 3 + 1
+    return f"Q{quarter}-{year}"
+
+def safe_int(value):
+    """安全转换为整数"""
+    if not value or value == 'None':
+        return None
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return None
+
 def run_basic_crawler():
     """运行基础版爬虫（原始逻辑）"""
 
@@ -65,125 +94,125 @@ def run_basic_crawler():
 
     supabase = create_client(supabase_url, supabase_key)
     base_url = 'https://www.alphavantage.co/query'
+    
+    # 复用连接：两次报表请求访问同一主机，第二次跳过TCP/TLS握手
+    session = requests.Session()
+    
+    # 滑动窗口限流：记录最近MAX_CALLS_PER_MINUTE次调用的时间
+    request_times = deque(maxlen=MAX_CALLS_PER_MINUTE)
+
+    def wait_for_rate_limit():
+        """等待到窗口内调用次数低于限额，并登记本次调用"""
+        if len(request_times) == MAX_CALLS_PER_MINUTE:
+            wait_seconds = RATE_LIMIT_WINDOW - (time.monotonic() - request_times[0])
+            if wait_seconds > 0:
+                print(f"达到API调用限额，等待 {wait_seconds:.1f} 秒...")
+                time.sleep(wait_seconds)
+        request_times.append(time.monotonic())
 
     def make_api_request(params):
         """发送API请求到Alpha Vantage"""
         params['apikey'] = alpha_vantage_key
-    
-    try:
-        print(f"正在请求: {params.get('function')} for {params.get('symbol', 'N/A')}")
-        response = requests.get(base_url, params=params, timeout=30)
-        data = response.json()
+        wait_for_rate_limit()
         
-        if 'Error Message' in data:
-            print(f"API错误: {data['Error Message']}")
+        try:
+            print(f"正在请求: {params.get('function')} for {params.get('symbol', 'N/A')}")
+            response = session.get(base_url, params=params, timeout=30)
+            data = response.json()
+            
+            if 'Error Message' in data:
+                print(f"API错误: {data['Error Message']}")
+                return None
+            
+            if 'Note' in data:
+                print(f"API限制: {data['Note']}")
+                return None
+            
+            return data
+        except Exception as e:
+            print(f"请求失败: {e}")
             return None
+
+    print("开始获取NETGEAR财务数据...")
+
+    # 获取NETGEAR公司ID
+    try:
+        # 公司ID跨进程缓存在本地文件中，重复运行时不再查询数据库
+        company_id = get_company_id(supabase, 'NTGR')
+        if not company_id:
+            print("错误: 未找到NETGEAR公司记录")
+            return False
         
-        if 'Note' in data:
-            print(f"API限制: {data['Note']}")
-            return None
+        print(f"找到NETGEAR公司ID: {company_id}")
         
-        return data
     except Exception as e:
-        print(f"请求失败: {e}")
-        return None
+        print(f"获取公司ID失败: {e}")
+        return False
 
-def format_period(date_string):
-    """格式化日期为季度格式"""
-    try:
-        date = datetime.strptime(date_string, '%Y-%m-%d')
-        quarter = (date.month - 1) // 3 + 1
-        return f"Q{quarter}-{date.year}"
-    except:
-        return date_string
+    # 获取损益表数据
+    income_params = {
+        'function': 'INCOME_STATEMENT',
+        'symbol': 'NTGR'
+    }
+    income_data = make_api_request(income_params)
 
-def safe_int(value):
-    """安全转换为整数"""
-    if not value or value == 'None':
-        return None
-    try:
-        return int(float(value))
-    except:
-        return None
+    if not income_data:
+        print("无法获取损益表数据")
+        return False
 
-print("开始获取NETGEAR财务数据...")
+    # 获取资产负债表数据
+    balance_params = {
+        'function': 'BALANCE_SHEET', 
+        'symbol': 'NTGR'
+    }
+    balance_data = make_api_request(balance_params)
 
-# 获取NETGEAR公司ID
-try:
-    company_result = supabase.table('companies').select('id').eq('symbol', 'NTGR').execute()
-    if not company_result.data:
-        print("错误: 未找到NETGEAR公司记录")
-        exit(1)
-    
-    company_id = company_result.data[0]['id']
-    print(f"找到NETGEAR公司ID: {company_id}")
-    
-except Exception as e:
-    print(f"获取公司ID失败: {e}")
-    exit(1)
-
-# 获取损益表数据
-income_params = {
-    'function': 'INCOME_STATEMENT',
-    'symbol': 'NTGR'
-}
-income_data = make_api_request(income_params)
-
-if not income_data:
-    print("无法获取损益表数据")
-    exit(1)
-
-print("等待12秒以避免API限制...")
-time.sleep(12)
-
-# 获取资产负债表数据
-balance_params = {
-    'function': 'BALANCE_SHEET', 
-    'symbol': 'NTGR'
-}
-balance_data = make_api_request(balance_params)
-
-if not balance_data:
-    print("无法获取资产负债表数据")
-    exit(1)
-
-# 处理数据
-quarterly_income = income_data.get('quarterlyReports', [])[:4]  # 最近4个季度
-quarterly_balance = balance_data.get('quarterlyReports', [])[:4]
-
-saved_count = 0
-
-for i, income_report in enumerate(quarterly_income):
-    if i < len(quarterly_balance):
-        balance_report = quarterly_balance[i]
-        
-        if income_report.get('fiscalDateEnding') == balance_report.get('fiscalDateEnding'):
-            period = format_period(income_report['fiscalDateEnding'])
-            
-            financial_record = {
-                'company_id': company_id,
-                'period': period,
-                'revenue': safe_int(income_report.get('totalRevenue')),
-                'gross_profit': safe_int(income_report.get('grossProfit')),
-                'net_income': safe_int(income_report.get('netIncome')),
-                'total_assets': safe_int(balance_report.get('totalAssets')),
-                'operating_expenses': safe_int(income_report.get('operatingExpenses')),
-                'cash_and_equivalents': safe_int(balance_report.get('cashAndCashEquivalentsAtCarryingValue')),
-                'total_debt': safe_int(balance_report.get('shortLongTermDebtTotal'))
-            }
+    if not balance_data:
+        print("无法获取资产负债表数据")
+        return False
+
+    # 处理数据
+    quarterly_income = income_data.get('quarterlyReports', [])[:4]  # 最近4个季度
+    quarterly_balance = balance_data.get('quarterlyReports', [])[:4]
+
+    records = []
+
+    for i, income_report in enumerate(quarterly_income):
+        if i < len(quarterly_balance):
+            balance_report = quarterly_balance[i]
             
-            try:
-                # 使用upsert避免重复插入
-                result = supabase.table('financial_data').upsert(
-                    financial_record,
-                    on_conflict='company_id,period'
-                ).execute()
+            if income_report.get('fiscalDateEnding') == balance_report.get('fiscalDateEnding'):
+                period = format_period(income_report['fiscalDateEnding'])
                 
-                print(f"✅ 保存 NTGR {period} 财务数据成功")
-                saved_count += 1
-                
-            except Exception as e:
-                print(f"❌ 保存数据失败: {e}")
+                financial_record = {
+                    'company_id': company_id,
+                    'period': period,
+                    'revenue': safe_int(income_report.get('totalRevenue')),
+                    'gross_profit': safe_int(income_report.get('grossProfit')),
+                    'net_income': safe_int(income_report.get('netIncome')),
+                    'total_assets': safe_int(balance_report.get('totalAssets')),
+                    'operating_expenses': safe_int(income_report.get('operatingExpenses')),
+                    'cash_and_equivalents': safe_int(balance_report.get('cashAndCashEquivalentsAtCarryingValue')),
+                    'total_debt': safe_int(balance_report.get('shortLongTermDebtTotal'))
+                }
+                records.append(financial_record)
+
+    saved_count = 0
+
+    if records:
+        try:
+            # 所有季度一次upsert，避免重复插入
+            result = supabase.table('financial_data').upsert(
+                records,
+                on_conflict='company_id,period'
+            ).execute()
+            
+            saved_count = len(result.data)
+            for record in result.data:
+                print(f"✅ 保存 NTGR {record['period']} 财务数据成功")
+            
+        except Exception as e:
+            print(f"❌ 保存数据失败: {e}")
 
     logger.info(f"🎉 基础版财务数据获取完成! 共保存 {saved_count} 条记录")
     return saved_count > 0
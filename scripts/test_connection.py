@@ -4,9 +4,7 @@
 """
 
 import os
-import requests
 from dotenv import load_dotenv
-from supabase import create_client
 
 # 加载环境变量
 load_dotenv('../.env.local')
@@ -20,6 +18,8 @@ print("开始测试连接...")
 # 测试Supabase连接
 try:
     print("1. 测试Supabase连接...")
+    # 按需导入，各测试只加载自己用到的客户端库
+    from supabase import create_client
     supabase = create_client(supabase_url, supabase_key)
     
     # 查询companies表
@@ -32,6 +32,7 @@ except Exception as e:
 # 测试Alpha Vantage API连接
 try:
     print("\n2. 测试Alpha Vantage API连接...")
+    import requests
     base_url = 'https://www.alphavantage.co/query'
     params = {
         'function': 'OVERVIEW',
@@ -13,6 +13,10 @@ load_dotenv('../.env.local')
 supabase_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
 supabase_key = os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
 
+if not supabase_url or not supabase_key:
+    print("❌ 缺少必要的环境变量: NEXT_PUBLIC_SUPABASE_URL 或 NEXT_PUBLIC_SUPABASE_ANON_KEY")
+    exit(1)
+
 print("🧪 测试前端查询逻辑...")
 
 try:
@@ -37,7 +41,9 @@ try:
         if financial_result.data:
             print(f"✅ 找到 {len(financial_result.data)} 条财务记录")
             for data in financial_result.data:
-                print(f"  - {data['period']}: 营收 ${data['revenue']:,}" if data['revenue'] else f"  - {data['period']}: 营收 N/A")
+                revenue = data['revenue']
+                revenue_str = f"${revenue:,}" if revenue else "N/A"
+                print(f"  - {data['period']}: 营收 {revenue_str}")
         else:
             print("❌ 未找到财务数据")
     else:
@@ -6,6 +6,7 @@
 
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from supabase import create_client
 from dotenv import load_dotenv
@@ -13,6 +14,44 @@ from dotenv import load_dotenv
 # 加载环境变量
 load_dotenv()
 
+# NETGEAR 2025年Q1业务分段数据（基于官方财报）
+Q1_2025_SEGMENTS = (
+    {
+        'category_name': 'NETGEAR for Business',
+        'revenue': 79200000,  # $79.2M
+        'revenue_percentage': 48.9,  # 79.2/162.1 * 100
+        'gross_margin': 46.3,
+        'yoy_growth': 15.4,
+        'qoq_growth': -2.0
+    },
+    {
+        'category_name': 'Home Networking',
+        'revenue': 61400000,  # $61.4M
+        'revenue_percentage': 37.9,  # 61.4/162.1 * 100
+        'gross_margin': 29.5,
+        'yoy_growth': -8.7,
+        'qoq_growth': -20.8
+    },
+    {
+        'category_name': 'Mobile',
+        'revenue': 21500000,  # $21.5M
+        'revenue_percentage': 13.3,  # 21.5/162.1 * 100
+        'gross_margin': 29.1,
+        'yoy_growth': -25.3,
+        'qoq_growth': -10.9
+    }
+)
+
+# Q1-2025各分段记录共用的期间和来源字段
+Q1_2025_SEGMENT_FIELDS = {
+    'period': 'Q1-2025',
+    'fiscal_year': 2025,
+    'fiscal_quarter': 1,
+    'category_level': 1,
+    'data_source': 'sec_filing',
+    'estimation_method': 'official_segment_data'
+}
+
 class Update2025SegmentData:
     def __init__(self):
         self.setup_logging()
@@ -26,7 +65,8 @@ class Update2025SegmentData:
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
             handlers=[
-                logging.FileHandler(log_filename),
+                # 延迟到第一条日志写入时才创建文件，提前退出时不留空日志
+                logging.FileHandler(log_filename, delay=True),
                 logging.StreamHandler()
             ]
         )
@@ -61,73 +101,27 @@ class Update2025SegmentData:
         
         company_id = self.get_company_id()
         
-        # NETGEAR 2025年Q1业务分段数据（基于官方财报）
         segment_data = [
-            {
-                'company_id': company_id,
-                'period': 'Q1-2025',
-                'fiscal_year': 2025,
-                'fiscal_quarter': 1,
-                'category_level': 1,
-                'category_name': 'NETGEAR for Business',
-                'revenue': 79200000,  # $79.2M
-                'revenue_percentage': 48.9,  # 79.2/162.1 * 100
-                'gross_margin': 46.3,
-                'yoy_growth': 15.4,
-                'qoq_growth': -2.0,
-                'data_source': 'sec_filing',
-                'estimation_method': 'official_segment_data'
-            },
-            {
-                'company_id': company_id,
-                'period': 'Q1-2025',
-                'fiscal_year': 2025,
-                'fiscal_quarter': 1,
-                'category_level': 1,
-                'category_name': 'Home Networking',
-                'revenue': 61400000,  # $61.4M
-                'revenue_percentage': 37.9,  # 61.4/162.1 * 100
-                'gross_margin': 29.5,
-                'yoy_growth': -8.7,
-                'qoq_growth': -20.8,
-                'data_source': 'sec_filing',
-                'estimation_method': 'official_segment_data'
-            },
-            {
-                'company_id': company_id,
-                'period': 'Q1-2025',
-                'fiscal_year': 2025,
-                'fiscal_quarter': 1,
-                'category_level': 1,
-                'category_name': 'Mobile',
-                'revenue': 21500000,  # $21.5M
-                'revenue_percentage': 13.3,  # 21.5/162.1 * 100
-                'gross_margin': 29.1,
-                'yoy_growth': -25.3,
-                'qoq_growth': -10.9,
-                'data_source': 'sec_filing',
-                'estimation_method': 'official_segment_data'
-            }
+            {'company_id': company_id, **segment, **Q1_2025_SEGMENT_FIELDS}
+            for segment in Q1_2025_SEGMENTS
         ]
         
-        inserted_count = 0
+        # 一次批量写入，已存在的分段由数据库按唯一键跳过
+        result = self.supabase.table('product_line_revenue').upsert(
+            segment_data,
+            on_conflict='company_id,period,category_name,category_level',
+            ignore_duplicates=True
+        ).execute()
         
+        inserted_names = {row['category_name'] for row in result.data}
         for segment in segment_data:
-            # 检查是否已存在
-            existing = self.supabase.table('product_line_revenue').select('id').eq('company_id', company_id).eq('fiscal_year', 2025).eq('fiscal_quarter', 1).eq('category_name', segment['category_name']).execute()
-            
-            if existing.data:
+            if segment['category_name'] not in inserted_names:
                 self.logger.info(f"Q1-2025 {segment['category_name']}数据已存在，跳过")
-                continue
-            
-            # 插入数据
-            result = self.supabase.table('product_line_revenue').insert(segment).execute()
-            if result.data:
-                inserted_count += 1
-                revenue_m = segment['revenue'] / 1000000
-                self.logger.info(f"✅ 插入Q1-2025 {segment['category_name']}: ${revenue_m:.1f}M ({segment['yoy_growth']:+.1f}% YoY)")
-            else:
-                self.logger.error(f"❌ 插入Q1-2025 {segment['category_name']}失败")
+        
+        inserted_count = len(result.data)
+        for segment in result.data:
+            revenue_m = segment['revenue'] / 1000000
+            self.logger.info(f"✅ 插入Q1-2025 {segment['category_name']}: ${revenue_m:.1f}M ({segment['yoy_growth']:+.1f}% YoY)")
         
         self.logger.info(f"✅ 成功插入 {inserted_count} 条Q1-2025业务分段数据")
         return inserted_count
@@ -169,7 +163,7 @@ class Update2025SegmentData:
         company_id = self.get_company_id()
         
         # 检查是否已存在正确的Q1-2025财务数据
-        existing = self.supabase.table('financial_data').select('*').eq('company_id', company_id).eq('fiscal_year', 2025).eq('fiscal_quarter', 1).eq('data_source', 'earnings_report').execute()
+        existing = self.supabase.table('financial_data').select('id').eq('company_id', company_id).eq('fiscal_year', 2025).eq('fiscal_quarter', 1).eq('data_source', 'earnings_report').execute()
         
         if existing.data:
             self.logger.info("Q1-2025主要财务数据已存在")
@@ -217,13 +211,17 @@ class Update2025SegmentData:
         total_inserted = 0
         
         try:
-            # 1. 更新Q1-2025主要财务数据
-            self.logger.info("步骤 1/3: 更新Q1-2025主要财务数据")
-            self.update_financial_data_2025_q1()
+            # 先解析公司ID，两个写入步骤并发时共用缓存结果
+            self.get_company_id()
             
-            # 2. 插入Q1-2025业务分段数据
+            # 1、2两步写入不同的表，互不依赖，并发执行
+            self.logger.info("步骤 1/3: 更新Q1-2025主要财务数据")
             self.logger.info("步骤 2/3: 插入Q1-2025业务分段数据")
-            q1_count = self.insert_2025_q1_segment_data()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                financial_future = executor.submit(self.update_financial_data_2025_q1)
+                segment_future = executor.submit(self.insert_2025_q1_segment_data)
+                financial_future.result()
+                q1_count = segment_future.result()
             total_inserted += q1_count
             
             # 3. 搜索Q2-2025数据信息
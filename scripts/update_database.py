@@ -6,6 +6,8 @@
 
 import os
 import sys
+import gzip
+import json
 import logging
 from datetime import datetime
 from supabase import create_client, Client
@@ -26,6 +28,15 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# 备份时每页读取的行数（PostgREST默认单次最多返回1000行）
+BACKUP_PAGE_SIZE = 1000
+
+# 按顺序执行的迁移文件（database目录下）及说明
+MIGRATION_FILES = (
+    ('migration_to_complete_schema.sql', "数据库结构迁移"),
+    ('migration_analytics_views.sql', "分析视图与函数迁移"),
+)
+
 class DatabaseUpdater:
     def __init__(self):
         """初始化数据库连接"""
@@ -55,68 +66,52 @@ class DatabaseUpdater:
         try:
             logger.info(f"开始执行: {description}")
             
-            # 分割SQL语句（以分号为分隔符）
-            statements = [stmt.strip() for stmt in sql_content.split(';') if stmt.strip()]
-            
-            success_count = 0
-            error_count = 0
-            
-            for i, statement in enumerate(statements):
-                try:
-                    # 跳过注释行和空行
-                    if statement.startswith('--') or not statement:
-                        continue
-                    
-                    # 使用supabase-py的rpc功能执行原始SQL
-                    result = self.supabase.rpc('exec_sql', {'sql': statement}).execute()
-                    
-                    success_count += 1
-                    logger.debug(f"SQL语句 {i+1} 执行成功")
-                    
-                except Exception as stmt_error:
-                    error_count += 1
-                    logger.warning(f"SQL语句 {i+1} 执行失败: {stmt_error}")
-                    # 继续执行其他语句
+            # 整个SQL文件通过一次rpc提交，由数据库自行解析，
+            # 按分号切分会拆坏函数体($$...$$)和字符串中的分号
+            self.supabase.rpc('exec_sql', {'sql': sql_content}).execute()
             
-            logger.info(f"{description} 完成: 成功 {success_count} 条, 失败 {error_count} 条")
-            return error_count == 0
+            logger.info(f"{description} 完成")
+            return True
             
         except Exception as e:
             logger.error(f"执行SQL失败: {description} - {e}")
             return False
 
-    def check_table_exists(self, table_name: str) -> bool:
-        """检查表是否存在"""
-        try:
-            result = self.supabase.table(table_name).select("*").limit(1).execute()
-            return True
-        except Exception:
-            return False
+    def backup_table(self, table_name: str, backup_dir: str) -> int:
+        """分页读取整表，逐行写入gzip压缩的NDJSON文件，返回备份行数"""
+        row_count = 0
+        offset = 0
+        
+        with gzip.open(f"{backup_dir}/{table_name}_backup.ndjson.gz", 'wt', encoding='utf-8') as f:
+            while True:
+                # 按id排序，保证各页之间不重不漏
+                page = self.supabase.table(table_name).select('*').order('id').range(
+                    offset, offset + BACKUP_PAGE_SIZE - 1
+                ).execute().data
+                
+                for row in page:
+                    f.write(json.dumps(row, default=str) + "\n")
+                row_count += len(page)
+                
+                if len(page) < BACKUP_PAGE_SIZE:
+                    break
+                offset += BACKUP_PAGE_SIZE
+        
+        return row_count
 
     def backup_existing_data(self):
         """备份现有重要数据"""
         logger.info("开始备份现有数据...")
         
         try:
-            # 备份companies表
-            companies = self.supabase.table('companies').select('*').execute()
-            logger.info(f"备份companies表: {len(companies.data)} 条记录")
-            
-            # 备份financial_data表
-            financial_data = self.supabase.table('financial_data').select('*').execute()
-            logger.info(f"备份financial_data表: {len(financial_data.data)} 条记录")
-            
-            # 将备份数据保存到文件
             backup_time = datetime.now().strftime('%Y%m%d_%H%M%S')
             backup_dir = f"backup_{backup_time}"
             os.makedirs(backup_dir, exist_ok=True)
             
-            import json
-            with open(f"{backup_dir}/companies_backup.json", 'w') as f:
-                json.dump(companies.data, f, indent=2, default=str)
-            
-            with open(f"{backup_dir}/financial_data_backup.json", 'w') as f:
-                json.dump(financial_data.data, f, indent=2, default=str)
+            # 备份companies表和financial_data表
+            for table_name in ('companies', 'financial_data'):
+                row_count = self.backup_table(table_name, backup_dir)
+                logger.info(f"备份{table_name}表: {row_count} 条记录")
                 
             logger.info(f"数据备份完成: {backup_dir}")
             return True
@@ -134,27 +129,26 @@ class DatabaseUpdater:
             logger.error("数据备份失败，停止迁移")
             return False
         
-        # 2. 执行迁移SQL
-        migration_file = os.path.join(os.path.dirname(__file__), '..', 'database', 'migration_to_complete_schema.sql')
-        
-        if not os.path.exists(migration_file):
-            logger.error(f"迁移文件不存在: {migration_file}")
-            return False
-        
-        try:
-            migration_sql = self.read_sql_file(migration_file)
-            success = self.execute_sql(migration_sql, "数据库结构迁移")
+        # 2. 按顺序执行迁移SQL（分析视图与函数依赖完整表结构，放在最后）
+        for file_name, description in MIGRATION_FILES:
+            migration_file = os.path.join(os.path.dirname(__file__), '..', 'database', file_name)
             
-            if success:
-                logger.info("数据库结构迁移完成")
-                return True
-            else:
-                logger.error("数据库结构迁移失败")
+            if not os.path.exists(migration_file):
+                logger.error(f"迁移文件不存在: {migration_file}")
                 return False
-                
-        except Exception as e:
-            logger.error(f"数据库迁移异常: {e}")
-            return False
+            
+            try:
+                migration_sql = self.read_sql_file(migration_file)
+                if not self.execute_sql(migration_sql, description):
+                    logger.error(f"{description}失败")
+                    return False
+                    
+            except Exception as e:
+                logger.error(f"{description}异常: {e}")
+                return False
+        
+        logger.info("数据库结构迁移完成")
+        return True
 
     def run_seed_data(self):
         """插入种子数据"""
@@ -196,10 +190,15 @@ class DatabaseUpdater:
             'data_update_log'
         ]
         
-        missing_tables = []
-        for table in required_tables:
-            if not self.check_table_exists(table):
-                missing_tables.append(table)
+        # 一次查询information_schema获取所有表，不再逐表试探读取
+        try:
+            result = self.supabase.rpc('list_public_tables').execute()
+        except Exception as e:
+            logger.error(f"查询数据库表列表失败: {e}")
+            return False
+        
+        present_tables = {row['table_name'] for row in result.data}
+        missing_tables = [table for table in required_tables if table not in present_tables]
         
         if missing_tables:
             logger.error(f"缺少以下表: {', '.join(missing_tables)}")
@@ -213,17 +212,17 @@ class DatabaseUpdater:
         logger.info("测试数据访问...")
         
         try:
-            # 测试公司数据
-            companies = self.supabase.table('companies').select('*').limit(5).execute()
-            logger.info(f"公司数据查询成功: {len(companies.data)} 条记录")
+            # 测试公司数据（head请求只返回行数，不传输数据行）
+            companies = self.supabase.table('companies').select('id', count='exact', head=True).execute()
+            logger.info(f"公司数据查询成功: {companies.count} 条记录")
             
             # 测试财务数据
-            financial = self.supabase.table('financial_data').select('*').limit(5).execute()
-            logger.info(f"财务数据查询成功: {len(financial.data)} 条记录")
+            financial = self.supabase.table('financial_data').select('id', count='exact', head=True).execute()
+            logger.info(f"财务数据查询成功: {financial.count} 条记录")
             
             # 测试产品线数据
-            product_line = self.supabase.table('product_line_revenue').select('*').limit(5).execute()
-            logger.info(f"产品线数据查询成功: {len(product_line.data)} 条记录")
+            product_line = self.supabase.table('product_line_revenue').select('id', count='exact', head=True).execute()
+            logger.info(f"产品线数据查询成功: {product_line.count} 条记录")
             
             return True
             
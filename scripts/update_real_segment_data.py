@@ -7,7 +7,9 @@
 import os
 import sys
 import logging
-from datetime import datetime
+import logging.handlers
+from collections import defaultdict
+from datetime import datetime, timezone
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
@@ -16,16 +18,44 @@ load_dotenv('.env.local')
 load_dotenv('../.env.local')
 
 # 配置日志
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# basicConfig只给MemoryHandler设置格式，落盘的FileHandler需单独设置
+_file_handler = logging.FileHandler('update_real_segment_data.log')
+_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler('update_real_segment_data.log'),
+        # 缓冲写入，攒满或遇到ERROR时才落盘
+        logging.handlers.MemoryHandler(
+            capacity=512,
+            flushLevel=logging.ERROR,
+            target=_file_handler
+        ),
         logging.StreamHandler(sys.stdout)
     ]
 )
 logger = logging.getLogger(__name__)
 
+# 单次upsert的最大行数，避免超出PostgREST请求体上限
+UPSERT_BATCH_SIZE = 1000
+
+# 基于Statista验证的NETGEAR官方分段数据（单位：美元）
+OFFICIAL_SEGMENT_DATA = {
+    2024: {
+        'Connected Home': 385950000,  # $385.95M
+        'NETGEAR for Business': 287810000,  # $287.81M
+        'total': 673760000  # $673.76M
+    },
+    2023: {
+        'Connected Home': 446870000,  # $446.87M  
+        'NETGEAR for Business': 293980000,  # $293.98M
+        'total': 740850000  # $740.85M
+    }
+}
+
 class RealSegmentDataUpdater:
     def __init__(self):
         """初始化数据更新服务"""
@@ -36,14 +66,20 @@ class RealSegmentDataUpdater:
             raise ValueError("缺少必要的环境变量")
         
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        # 公司ID不会变化，按股票代码缓存，避免更新、验证、记录日志时重复查询
+        self._company_id_cache = {}
         logger.info("真实分段数据更新服务初始化完成")
 
     def get_company_id(self, symbol: str):
         """获取公司ID"""
+        if symbol in self._company_id_cache:
+            return self._company_id_cache[symbol]
+        
         try:
             result = self.supabase.table('companies').select('id').eq('symbol', symbol).execute()
             if result.data:
-                return result.data[0]['id']
+                self._company_id_cache[symbol] = result.data[0]['id']
+                return self._company_id_cache[symbol]
             return None
         except Exception as e:
             logger.error(f"获取公司ID失败 {symbol}: {e}")
@@ -51,19 +87,7 @@ class RealSegmentDataUpdater:
 
     def get_official_segment_data(self):
         """获取官方业务分段数据"""
-        # 基于Statista验证的NETGEAR官方分段数据（单位：美元）
-        return {
-            2024: {
-                'Connected Home': 385950000,  # $385.95M
-                'NETGEAR for Business': 287810000,  # $287.81M
-                'total': 673760000  # $673.76M
-            },
-            2023: {
-                'Connected Home': 446870000,  # $446.87M  
-                'NETGEAR for Business': 293980000,  # $293.98M
-                'total': 740850000  # $740.85M
-            }
-        }
+        return OFFICIAL_SEGMENT_DATA
 
     def update_segment_data_to_database(self, symbol: str = 'NTGR'):
         """将真实分段数据更新到数据库"""
@@ -74,37 +98,46 @@ class RealSegmentDataUpdater:
                 return False
             
             segment_data = self.get_official_segment_data()
-            total_inserted = 0
+            all_records = []
+            inserted_records = []
+            # 本批记录共用一个带时区的时间戳
+            now_iso = datetime.now(timezone.utc).isoformat()
             
             logger.info(f"🏢 开始更新 {symbol} 真实业务分段数据...")
             
+            # 一次获取所有年度的季度数据作为参考，按年度分组
+            financial_result = self.supabase.table('financial_data').select(
+                'period,fiscal_quarter,fiscal_year'
+            ).eq('company_id', company_id).in_(
+                'fiscal_year', list(segment_data.keys())
+            ).order('fiscal_quarter', desc=False).execute()
+            
+            quarters_by_year = defaultdict(list)
+            for row in financial_result.data:
+                quarters_by_year[row['fiscal_year']].append(row)
+            
             for year, year_data in segment_data.items():
-                logger.info(f"📊 处理 {year} 年度数据...")
-                
-                # 获取该年度的季度数据作为参考
-                financial_result = self.supabase.table('financial_data').select('*').eq(
-                    'company_id', company_id
-                ).eq('fiscal_year', year).order('fiscal_quarter', desc=False).execute()
-                
-                if not financial_result.data:
+                year_quarters = quarters_by_year.get(year, [])
+                if not year_quarters:
                     logger.warning(f"未找到 {year} 年度的财务数据，跳过")
                     continue
                 
-                logger.info(f"找到 {year} 年度 {len(financial_result.data)} 个季度的财务数据")
+                # 平均分配年度分段数据到各季度，季度值和占比每年只算一次
+                quarters_count = len(year_quarters)
+                connected_home_quarterly = year_data['Connected Home'] // quarters_count
+                business_quarterly = year_data['NETGEAR for Business'] // quarters_count
+                connected_home_percentage = (connected_home_quarterly / year_data['total']) * 100
+                business_percentage = (business_quarterly / year_data['total']) * 100
                 
-                # 为每个季度分配分段数据
-                quarters_count = len(financial_result.data)
-                for quarter_data in financial_result.data:
+                year_start = len(all_records)
+                for quarter_data in year_quarters:
                     period = quarter_data['period']
                     quarter = quarter_data['fiscal_quarter']
                     
-                    # 平均分配年度分段数据到各季度
-                    connected_home_quarterly = year_data['Connected Home'] // quarters_count
-                    business_quarterly = year_data['NETGEAR for Business'] // quarters_count
-                    
-                    logger.info(f"📈 插入 {period} 分段数据:")
-                    logger.info(f"  - Connected Home: ${connected_home_quarterly/1e6:.1f}M")
-                    logger.info(f"  - NETGEAR for Business: ${business_quarterly/1e6:.1f}M")
+                    logger.debug(
+                        f"📈 {period} 分段数据: Connected Home ${connected_home_quarterly/1e6:.1f}M, "
+                        f"NETGEAR for Business ${business_quarterly/1e6:.1f}M"
+                    )
                     
                     # 准备分段数据记录
                     segment_records = [
@@ -116,11 +149,11 @@ class RealSegmentDataUpdater:
                             'category_level': 1,
                             'category_name': 'Connected Home',
                             'revenue': connected_home_quarterly,
-                            'revenue_percentage': (connected_home_quarterly / year_data['total']) * 100,
+                            'revenue_percentage': connected_home_percentage,
                             'data_source': 'sec_filing',
                             'estimation_method': 'official_segment_data',
-                            'created_at': datetime.utcnow().isoformat(),
-                            'updated_at': datetime.utcnow().isoformat()
+                            'created_at': now_iso,
+                            'updated_at': now_iso
                         },
                         {
                             'company_id': company_id,
@@ -130,38 +163,38 @@ class RealSegmentDataUpdater:
                             'category_level': 1,
                             'category_name': 'NETGEAR for Business',
                             'revenue': business_quarterly,
-                            'revenue_percentage': (business_quarterly / year_data['total']) * 100,
+                            'revenue_percentage': business_percentage,
                             'data_source': 'sec_filing',
                             'estimation_method': 'official_segment_data',
-                            'created_at': datetime.utcnow().isoformat(),
-                            'updated_at': datetime.utcnow().isoformat()
+                            'created_at': now_iso,
+                            'updated_at': now_iso
                         }
                     ]
                     
-                    # 先检查是否存在相同记录，然后直接插入
-                    try:
-                        # 检查是否已存在相同记录
-                        existing = self.supabase.table('product_line_revenue').select('id').eq(
-                            'company_id', company_id
-                        ).eq('period', period).eq('data_source', 'sec_filing').execute()
-                        
-                        if existing.data:
-                            logger.info(f"⚠️ {period} 已存在SEC分段数据，跳过")
-                            continue
-                        
-                        # 直接插入数据
-                        result = self.supabase.table('product_line_revenue').insert(
-                            segment_records
+                    all_records.extend(segment_records)
+                
+                logger.info(f"📊 {year} 年度: 准备 {len(all_records) - year_start} 条分段记录，覆盖 {quarters_count} 个季度")
+            
+            # 批量写入所有分段记录，已存在的记录由数据库按唯一键跳过
+            if all_records:
+                try:
+                    for start in range(0, len(all_records), UPSERT_BATCH_SIZE):
+                        batch = all_records[start:start + UPSERT_BATCH_SIZE]
+                        result = self.supabase.table('product_line_revenue').upsert(
+                            batch,
+                            on_conflict='company_id,period,category_name,category_level',
+                            ignore_duplicates=True
                         ).execute()
-                        
-                        if result.data:
-                            inserted_count = len(result.data)
-                            total_inserted += inserted_count
-                            logger.info(f"✅ {period} 成功插入 {inserted_count} 条分段记录")
-                        
-                    except Exception as e:
-                        logger.error(f"插入 {period} 分段数据失败: {e}")
-                        continue
+                        inserted_records.extend(result.data)
+                    
+                    if len(inserted_records) < len(all_records):
+                        logger.info(f"⚠️ {len(all_records) - len(inserted_records)} 条分段记录已存在，跳过")
+                    logger.info(f"✅ 成功插入 {len(inserted_records)} 条分段记录")
+                    
+                except Exception as e:
+                    logger.error(f"批量写入分段数据失败: {e}")
+            
+            total_inserted = len(inserted_records)
             
             # 记录更新活动
             self.log_update_activity(symbol, total_inserted)
@@ -178,24 +211,25 @@ class RealSegmentDataUpdater:
     def verify_segment_data(self, symbol: str = 'NTGR'):
         """验证插入的分段数据"""
         try:
+            logger.info("🔍 验证插入的真实分段数据...")
+            
             company_id = self.get_company_id(symbol)
             if not company_id:
                 return False
             
-            logger.info("🔍 验证插入的真实分段数据...")
-            
             # 查询所有SEC filing数据源的分段数据
-            result = self.supabase.table('product_line_revenue').select('*').eq(
+            result = self.supabase.table('product_line_revenue').select('fiscal_year,category_name,revenue').eq(
                 'company_id', company_id
             ).eq('data_source', 'sec_filing').order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
+            records = result.data
             
-            if not result.data:
+            if not records:
                 logger.warning("未找到SEC filing数据源的分段数据")
                 return False
             
             # 按年度分组统计
             year_stats = {}
-            for record in result.data:
+            for record in records:
                 year = record['fiscal_year']
                 category = record['category_name']
                 revenue = record['revenue']
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+数据验证脚本公共基类
+持有Supabase客户端，经本地缓存获取公司ID，分页读取完整结果
+"""
+
+import logging
+from typing import Callable, Dict, List, Optional
+from supabase import create_client, Client
+from company_cache import get_company_id as get_cached_company_id
+
+logger = logging.getLogger(__name__)
+
+# 分页读取时每页的行数（PostgREST默认单次最多返回1000行）
+PAGE_SIZE = 1000
+
+class SupabaseVerifier:
+    def __init__(self, supabase_url: Optional[str], supabase_key: Optional[str]):
+        """初始化Supabase客户端"""
+        if not supabase_url or not supabase_key:
+            raise ValueError("Supabase凭据未找到")
+
+        self.supabase: Client = create_client(supabase_url, supabase_key)
+
+    def get_company_id(self, symbol: str = 'NTGR') -> Optional[str]:
+        """获取公司ID"""
+        try:
+            # 公司ID跨进程缓存在本地文件中，重复运行时不再查询数据库
+            return get_cached_company_id(self.supabase, symbol)
+        except Exception as e:
+            logger.error(f"获取公司ID失败 {symbol}: {e}")
+            return None
+
+    def fetch_pages(self, build_query: Callable, page_size: int = PAGE_SIZE) -> List[Dict]:
+        """按页读取查询的全部结果，避免被PostgREST单次返回行数上限截断
+        
+        build_query每次调用须返回新的查询（range会在查询上追加参数，不能重复使用），
+        且查询需有确定的排序，保证分页不重不漏
+        """
+        rows = []
+        offset = 0
+        while True:
+            page = build_query().range(offset, offset + page_size - 1).execute().data
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            offset += page_size
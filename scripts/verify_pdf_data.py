@@ -6,17 +6,25 @@
 import os
 import logging
 from datetime import datetime
-from supabase import create_client
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict
 from dotenv import load_dotenv
+from verifier_base import SupabaseVerifier
+from concurrent_queries import fetch_all
+from analytics_migration import requires_analytics_migration
 
-# 加载环境变量
+# 加载环境变量，导入时只解析一次
 load_dotenv()
 
-class PDFDataVerifier:
+SUPABASE_URL = os.getenv('SUPABASE_URL') or os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_ANON_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+
+class PDFDataVerifier(SupabaseVerifier):
     def __init__(self):
         self.setup_logging()
-        self.setup_supabase()
-        self.netgear_company_id = None
+        super().__init__(SUPABASE_URL, SUPABASE_KEY)
+        self.logger.info("✅ Supabase客户端初始化成功")
         
     def setup_logging(self):
         """设置日志"""
@@ -26,90 +34,66 @@ class PDFDataVerifier:
         )
         self.logger = logging.getLogger(__name__)
         
-    def setup_supabase(self):
-        """初始化Supabase客户端"""
-        supabase_url = os.getenv('SUPABASE_URL') or os.getenv('NEXT_PUBLIC_SUPABASE_URL')
-        supabase_key = os.getenv('SUPABASE_ANON_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
-        
-        if not supabase_url or not supabase_key:
-            raise ValueError("Supabase凭据未找到")
-            
-        self.supabase = create_client(supabase_url, supabase_key)
-        self.logger.info("✅ Supabase客户端初始化成功")
-        
-    def get_company_id(self) -> str:
-        """获取NETGEAR公司ID"""
-        if self.netgear_company_id:
-            return self.netgear_company_id
-            
-        result = self.supabase.table('companies').select('id').eq('symbol', 'NTGR').execute()
-        if not result.data:
-            raise ValueError("未找到NETGEAR公司记录")
-            
-        self.netgear_company_id = result.data[0]['id']
-        return self.netgear_company_id
+    def verification_queries(self, company_id: str) -> Dict:
+        """构建各验证步骤所需的查询，彼此互不依赖，可并发执行"""
+        return {
+            # 各数据源的记录数及最近3条财务数据（数据库端分组）
+            'financial': self.supabase.table('financial_by_source').select(
+                'data_source, period, revenue, source_count'
+            ).eq('company_id', company_id).order('data_source').order('source_rank'),
+            # 最近4个季度的分段数据，附带季度总收入（数据库端汇总），季度内按收入从高到低
+            'segments': self.supabase.table('segment_by_period').select(
+                'period, category_name, revenue, revenue_percentage, data_source, yoy_growth, gross_margin, period_revenue, company_segment_count'
+            ).eq('company_id', company_id).lte('period_rank', 4).order('period_rank').order('period').order(
+                'revenue', desc=True, nullsfirst=False
+            ),
+            # 期间覆盖汇总（缺少分段数据的期间由数据库EXCEPT得出）
+            'coverage': self.supabase.rpc('period_coverage_summary', {'p_company_id': company_id}),
+            # 最新的财务数据
+            'latest_financial': self.supabase.table('financial_data').select(
+                'period, revenue, fiscal_year, fiscal_quarter'
+            ).eq('company_id', company_id).order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).limit(1),
+            # 最新一个季度的全部分段数据，按收入从高到低
+            'latest_segments': self.supabase.table('segment_by_period').select(
+                'period, category_name, revenue, revenue_percentage, yoy_growth, data_source'
+            ).eq('company_id', company_id).eq('period_rank', 1).order('revenue', desc=True, nullsfirst=False)
+        }
     
-    def verify_financial_data(self):
+    def verify_financial_data(self, result):
         """验证财务数据"""
         self.logger.info("📊 验证财务数据...")
         
-        company_id = self.get_company_id()
-        
-        # 获取所有财务数据
-        result = self.supabase.table('financial_data').select(
-            'period, fiscal_year, fiscal_quarter, revenue, data_source'
-        ).eq('company_id', company_id).order('fiscal_year').order('fiscal_quarter').execute()
-        
-        self.logger.info(f"📈 总财务记录数: {len(result.data)}")
-        
-        # 按数据源分组
+        # 按数据源分组（每个数据源最多3条，已按由新到旧排序）
         by_source = {}
         for record in result.data:
-            source = record['data_source']
-            if source not in by_source:
-                by_source[source] = []
-            by_source[source].append(record)
+            by_source.setdefault(record['data_source'], []).append(record)
+        
+        total_records = sum(records[0]['source_count'] for records in by_source.values())
+        self.logger.info(f"📈 总财务记录数: {total_records}")
         
         for source, records in by_source.items():
-            self.logger.info(f"   - {source}: {len(records)}条记录")
+            self.logger.info(f"   - {source}: {records[0]['source_count']}条记录")
             
             # 显示最近几条记录
-            recent_records = sorted(records, key=lambda x: (x['fiscal_year'], x['fiscal_quarter']), reverse=True)[:3]
-            for record in recent_records:
+            for record in records:
                 revenue_m = (record['revenue'] or 0) / 1000000
                 self.logger.info(f"     * {record['period']}: ${revenue_m:.1f}M")
     
-    def verify_segment_data(self):
+    def verify_segment_data(self, result):
         """验证业务分段数据"""
         self.logger.info("📈 验证业务分段数据...")
         
-        company_id = self.get_company_id()
-        
-        # 获取所有分段数据
-        result = self.supabase.table('product_line_revenue').select(
-            'period, fiscal_year, fiscal_quarter, category_name, revenue, revenue_percentage, data_source, yoy_growth, gross_margin'
-        ).eq('company_id', company_id).order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
+        total_records = result.data[0]['company_segment_count'] if result.data else 0
+        self.logger.info(f"📊 总分段记录数: {total_records}")
         
-        self.logger.info(f"📊 总分段记录数: {len(result.data)}")
-        
-        # 按年份和季度分组
-        by_period = {}
-        for record in result.data:
-            period = record['period']
-            if period not in by_period:
-                by_period[period] = []
-            by_period[period].append(record)
-        
-        # 显示最近几个季度的详细数据
-        recent_periods = sorted(by_period.keys(), reverse=True)[:4]
-        
-        for period in recent_periods:
-            segments = by_period[period]
-            total_revenue = sum(s['revenue'] or 0 for s in segments)
+        # 显示最近几个季度的详细数据（查询结果已按季度由新到旧、季度内按收入排序）
+        for period, group in groupby(result.data, key=itemgetter('period')):
+            segments = list(group)
+            total_revenue = segments[0]['period_revenue'] or 0
             
             self.logger.info(f"🔍 {period} (总收入: ${total_revenue/1000000:.1f}M):")
             
-            for segment in sorted(segments, key=lambda x: x['revenue'] or 0, reverse=True):
+            for segment in segments:
                 revenue_m = (segment['revenue'] or 0) / 1000000
                 growth_info = f" ({segment['yoy_growth']:+.1f}%)" if segment.get('yoy_growth') else ""
                 margin_info = f" [毛利率: {segment['gross_margin']:.1f}%]" if segment.get('gross_margin') else ""
@@ -117,71 +101,40 @@ class PDFDataVerifier:
                 
                 self.logger.info(f"  - {segment['category_name']}: ${revenue_m:.1f}M ({segment['revenue_percentage']:.1f}%){growth_info}{margin_info}{source_info}")
     
-    def check_data_completeness(self):
+    def check_data_completeness(self, result):
         """检查数据完整性"""
         self.logger.info("🔍 检查数据完整性...")
         
-        company_id = self.get_company_id()
-        
-        # 检查期间覆盖
-        financial_periods = set()
-        segment_periods = set()
-        
-        # 获取财务数据期间
-        financial_result = self.supabase.table('financial_data').select('period').eq('company_id', company_id).execute()
-        for record in financial_result.data:
-            financial_periods.add(record['period'])
-        
-        # 获取分段数据期间
-        segment_result = self.supabase.table('product_line_revenue').select('period').eq('company_id', company_id).execute()
-        for record in segment_result.data:
-            segment_periods.add(record['period'])
+        coverage = result.data[0]
         
-        self.logger.info(f"📅 财务数据覆盖期间: {len(financial_periods)}个")
-        self.logger.info(f"📅 分段数据覆盖期间: {len(segment_periods)}个")
+        self.logger.info(f"📅 财务数据覆盖期间: {coverage['financial_period_count']}个")
+        self.logger.info(f"📅 分段数据覆盖期间: {coverage['segment_period_count']}个")
         
         # 检查缺失的分段数据
-        missing_segments = financial_periods - segment_periods
+        missing_segments = coverage['missing_segment_periods']
         if missing_segments:
-            self.logger.warning(f"⚠️ 缺少分段数据的期间: {sorted(missing_segments)}")
+            self.logger.warning(f"⚠️ 缺少分段数据的期间: {missing_segments}")
         else:
             self.logger.info("✅ 所有财务期间都有对应的分段数据")
         
         # 检查期间范围
-        all_periods = sorted(financial_periods | segment_periods)
-        if all_periods:
-            self.logger.info(f"📊 数据时间范围: {all_periods[0]} 到 {all_periods[-1]}")
+        if coverage['first_period']:
+            self.logger.info(f"📊 数据时间范围: {coverage['first_period']} 到 {coverage['last_period']}")
     
-    def generate_summary_report(self):
+    def generate_summary_report(self, latest_financial, latest_segments):
         """生成数据摘要报告"""
         self.logger.info("📋 生成数据摘要报告...")
         
-        company_id = self.get_company_id()
-        
-        # 获取最新的财务数据
-        latest_financial = self.supabase.table('financial_data').select(
-            'period, revenue, fiscal_year, fiscal_quarter'
-        ).eq('company_id', company_id).order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).limit(1).execute()
-        
         if latest_financial.data:
             latest = latest_financial.data[0]
             revenue_m = (latest['revenue'] or 0) / 1000000
             self.logger.info(f"💰 最新财报: {latest['period']} - ${revenue_m:.1f}M")
         
-        # 获取最新的分段数据
-        latest_segments = self.supabase.table('product_line_revenue').select(
-            'period, category_name, revenue, revenue_percentage, yoy_growth'
-        ).eq('company_id', company_id).order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).limit(10).execute()
-        
         if latest_segments.data:
             period = latest_segments.data[0]['period']
             self.logger.info(f"📈 {period} 业务分段:")
             
-            # 按收入排序
-            segments_by_period = [s for s in latest_segments.data if s['period'] == period]
-            segments_by_period.sort(key=lambda x: x['revenue'] or 0, reverse=True)
-            
-            for segment in segments_by_period:
+            for segment in latest_segments.data:
                 revenue_m = (segment['revenue'] or 0) / 1000000
                 growth_info = f" ({segment['yoy_growth']:+.1f}%)" if segment.get('yoy_growth') else ""
                 self.logger.info(f"  🔹 {segment['category_name']}: ${revenue_m:.1f}M ({segment['revenue_percentage']:.1f}%){growth_info}")
@@ -205,16 +158,24 @@ class PDFDataVerifier:
         self.logger.info("=" * 60)
         
         try:
-            self.verify_financial_data()
+            # 各步骤的查询互不依赖，先并发取回，再按顺序输出报告
+            company_id = self.get_company_id()
+            if not company_id:
+                raise ValueError("未找到NETGEAR公司记录")
+            
+            with requires_analytics_migration():
+                results = fetch_all(self.verification_queries(company_id))
+            
+            self.verify_financial_data(results['financial'])
             self.logger.info("")
             
-            self.verify_segment_data()
+            self.verify_segment_data(results['segments'])
             self.logger.info("")
             
-            self.check_data_completeness()
+            self.check_data_completeness(results['coverage'])
             self.logger.info("")
             
-            self.generate_summary_report()
+            self.generate_summary_report(results['latest_financial'], results['latest_segments'])
             
         except Exception as e:
             self.logger.error(f"验证过程中发生错误: {e}")
@@ -6,13 +6,18 @@
 import os
 import sys
 import logging
+from collections import defaultdict
 from datetime import datetime
-from supabase import create_client, Client
+from typing import Dict
 from dotenv import load_dotenv
+from verifier_base import SupabaseVerifier
+from concurrent_queries import fetch_all
 
-# 加载环境变量
-load_dotenv('.env.local')
-load_dotenv('../.env.local')
+# 加载项目根目录的环境变量（与当前工作目录无关），导入时只解析一次
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env.local'))
+
+SUPABASE_URL = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+SUPABASE_KEY = os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
 
 # 配置日志
 logging.basicConfig(
@@ -22,174 +27,137 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class SystemStatusVerifier:
+class SystemStatusVerifier(SupabaseVerifier):
     def __init__(self):
         """初始化验证服务"""
-        self.supabase_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
-        self.supabase_key = os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
-        
-        if not all([self.supabase_url, self.supabase_key]):
-            raise ValueError("缺少必要的环境变量")
-        
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        super().__init__(SUPABASE_URL, SUPABASE_KEY)
         logger.info("系统状态验证服务初始化完成")
 
-    def get_company_id(self, symbol: str = 'NTGR'):
-        """获取公司ID"""
-        try:
-            result = self.supabase.table('companies').select('id').eq('symbol', symbol).execute()
-            if result.data:
-                return result.data[0]['id']
-            return None
-        except Exception as e:
-            logger.error(f"获取公司ID失败: {e}")
-            return None
+    def check_queries(self, company_id: str) -> Dict:
+        """构建各项检查所需的查询（分页读取为可调用对象），彼此互不依赖，可并发执行"""
+        return {
+            # 只取最近5条用于展示，总数由count='exact'随响应头返回
+            'financial': self.supabase.table('financial_data').select('period, revenue', count='exact').eq(
+                'company_id', company_id
+            ).eq('data_source', 'alpha_vantage').order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).limit(5),
+            # 分页读取全部SEC分段数据，按id补充排序保证分页稳定
+            'segments': lambda: self.fetch_pages(
+                lambda: self.supabase.table('product_line_revenue').select('fiscal_year, category_name, revenue').eq(
+                    'company_id', company_id
+                ).eq('data_source', 'sec_filing').order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).order('id')
+            ),
+            # 产品线、地理估算数据只需条数，head=True不返回数据行
+            'product_estimated': self.supabase.table('product_line_revenue').select('id', count='exact', head=True).eq(
+                'company_id', company_id
+            ).eq('data_source', 'estimated'),
+            'geo_estimated': self.supabase.table('geographic_revenue').select('id', count='exact', head=True).eq(
+                'company_id', company_id
+            ).eq('data_source', 'estimated'),
+            # 最近的数据更新日志
+            'update_logs': self.supabase.table('data_update_log').select(
+                'created_at, created_by, records_affected, status'
+            ).order('created_at', desc=True).limit(5)
+        }
 
-    def verify_financial_data(self, symbol: str = 'NTGR'):
+    def verify_financial_data(self, result):
         """验证财务数据状态"""
-        try:
-            company_id = self.get_company_id(symbol)
-            if not company_id:
-                return False
-            
-            logger.info("💰 验证Alpha Vantage真实财务数据...")
-            
-            result = self.supabase.table('financial_data').select('*').eq(
-                'company_id', company_id
-            ).eq('data_source', 'alpha_vantage').order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
-            
-            if not result.data:
-                logger.error("❌ 未找到Alpha Vantage财务数据")
-                return False
-            
-            logger.info(f"✅ 找到 {len(result.data)} 条Alpha Vantage财务数据:")
-            for item in result.data[:5]:
-                period = item['period']
-                revenue = item.get('revenue', 0)
-                logger.info(f"  - {period}: ${revenue/1e6:.1f}M")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"验证财务数据失败: {e}")
+        logger.info("💰 验证Alpha Vantage真实财务数据...")
+        
+        if not result.data:
+            logger.error("❌ 未找到Alpha Vantage财务数据")
             return False
+        
+        logger.info(f"✅ 找到 {result.count} 条Alpha Vantage财务数据:")
+        for item in result.data:
+            period = item['period']
+            revenue = item.get('revenue', 0)
+            logger.info(f"  - {period}: ${revenue/1e6:.1f}M")
+        
+        return True
 
-    def verify_segment_data(self, symbol: str = 'NTGR'):
+    def verify_segment_data(self, records):
         """验证真实业务分段数据"""
-        try:
-            company_id = self.get_company_id(symbol)
-            if not company_id:
-                return False
-            
-            logger.info("📊 验证SEC真实业务分段数据...")
-            
-            result = self.supabase.table('product_line_revenue').select('*').eq(
-                'company_id', company_id
-            ).eq('data_source', 'sec_filing').order('fiscal_year', desc=True).order('fiscal_quarter', desc=True).execute()
-            
-            if not result.data:
-                logger.error("❌ 未找到SEC业务分段数据")
-                return False
-            
-            # 按年度统计
-            year_stats = {}
-            for record in result.data:
-                year = record['fiscal_year']
-                category = record['category_name']
-                revenue = record['revenue']
-                
-                if year not in year_stats:
-                    year_stats[year] = {}
-                if category not in year_stats[year]:
-                    year_stats[year][category] = []
-                
-                year_stats[year][category].append(revenue)
-            
-            logger.info(f"✅ 找到 {len(result.data)} 条SEC业务分段数据:")
-            for year in sorted(year_stats.keys(), reverse=True):
-                logger.info(f"  {year}年:")
-                for category, revenues in year_stats[year].items():
-                    category_total = sum(revenues)
-                    logger.info(f"    - {category}: ${category_total/1e6:.1f}M ({len(revenues)}个季度)")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"验证业务分段数据失败: {e}")
+        logger.info("📊 验证SEC真实业务分段数据...")
+        
+        if not records:
+            logger.error("❌ 未找到SEC业务分段数据")
             return False
+        
+        # 按年度、分段累计 [营收合计, 季度数]
+        year_stats = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        for record in records:
+            stats = year_stats[record['fiscal_year']][record['category_name']]
+            stats[0] += record['revenue'] or 0
+            stats[1] += 1
+        
+        logger.info(f"✅ 找到 {len(records)} 条SEC业务分段数据:")
+        for year in sorted(year_stats.keys(), reverse=True):
+            logger.info(f"  {year}年:")
+            for category, (category_total, quarter_count) in year_stats[year].items():
+                logger.info(f"    - {category}: ${category_total/1e6:.1f}M ({quarter_count}个季度)")
+        
+        return True
 
-    def verify_estimated_data_cleanup(self, symbol: str = 'NTGR'):
+    def verify_estimated_data_cleanup(self, product_estimated, geo_estimated):
         """验证估算数据清理状态"""
-        try:
-            company_id = self.get_company_id(symbol)
-            if not company_id:
-                return False
-            
-            logger.info("🧹 验证估算数据清理状态...")
-            
-            # 检查产品线估算数据
-            product_estimated = self.supabase.table('product_line_revenue').select('id').eq(
-                'company_id', company_id
-            ).eq('data_source', 'estimated').execute()
-            
-            # 检查地理估算数据
-            geo_estimated = self.supabase.table('geographic_revenue').select('id').eq(
-                'company_id', company_id
-            ).eq('data_source', 'estimated').execute()
-            
-            if len(product_estimated.data) == 0 and len(geo_estimated.data) == 0:
-                logger.info("✅ 估算数据清理完成 - 无剩余估算数据")
-                return True
-            else:
-                logger.warning(f"⚠️ 发现剩余估算数据: 产品线{len(product_estimated.data)}条, 地理{len(geo_estimated.data)}条")
-                return False
-                
-        except Exception as e:
-            logger.error(f"验证数据清理状态失败: {e}")
+        logger.info("🧹 验证估算数据清理状态...")
+        
+        if product_estimated.count == 0 and geo_estimated.count == 0:
+            logger.info("✅ 估算数据清理完成 - 无剩余估算数据")
+            return True
+        else:
+            logger.warning(f"⚠️ 发现剩余估算数据: 产品线{product_estimated.count}条, 地理{geo_estimated.count}条")
             return False
 
-    def verify_data_update_logs(self):
+    def verify_data_update_logs(self, result):
         """验证数据更新日志"""
-        try:
-            logger.info("📝 验证最近的数据更新日志...")
-            
-            result = self.supabase.table('data_update_log').select('*').order('created_at', desc=True).limit(5).execute()
-            
-            if not result.data:
-                logger.warning("⚠️ 未找到数据更新日志")
-                return False
-            
-            logger.info(f"✅ 找到 {len(result.data)} 条最近的更新日志:")
-            for log in result.data:
-                created_by = log.get('created_by', 'unknown')
-                records_affected = log.get('records_affected', 0)
-                status = log.get('status', 'unknown')
-                created_at = log.get('created_at', '')[:19]  # 只显示日期时间部分
-                logger.info(f"  - {created_at}: {created_by} - {records_affected}条记录 ({status})")
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"验证更新日志失败: {e}")
+        logger.info("📝 验证最近的数据更新日志...")
+        
+        if not result.data:
+            logger.warning("⚠️ 未找到数据更新日志")
             return False
+        
+        logger.info(f"✅ 找到 {len(result.data)} 条最近的更新日志:")
+        for log in result.data:
+            created_by = log.get('created_by', 'unknown')
+            records_affected = log.get('records_affected', 0)
+            status = log.get('status', 'unknown')
+            created_at = log.get('created_at', '')[:19]  # 只显示日期时间部分
+            logger.info(f"  - {created_at}: {created_by} - {records_affected}条记录 ({status})")
+        
+        return True
 
-    def run_complete_verification(self):
+    def run_complete_verification(self, symbol: str = 'NTGR'):
         """运行完整的系统验证"""
         logger.info("=" * 60)
         logger.info("🔍 开始完整的系统状态验证")
         logger.info("=" * 60)
         
+        company_id = self.get_company_id(symbol)
+        if not company_id:
+            logger.error(f"❌ 未找到{symbol}公司记录")
+            return False
+        
+        # 每项检查对应的报告方法及其所需数据
         checks = [
-            ("Alpha Vantage财务数据", self.verify_financial_data),
-            ("SEC业务分段数据", self.verify_segment_data),
-            ("估算数据清理状态", self.verify_estimated_data_cleanup),
-            ("数据更新日志", self.verify_data_update_logs)
+            ("Alpha Vantage财务数据", self.verify_financial_data, ('financial',)),
+            ("SEC业务分段数据", self.verify_segment_data, ('segments',)),
+            ("估算数据清理状态", self.verify_estimated_data_cleanup, ('product_estimated', 'geo_estimated')),
+            ("数据更新日志", self.verify_data_update_logs, ('update_logs',))
         ]
         
+        # 各项检查的数据读取互不依赖，先并发取回，再按顺序输出报告，日志不会交错
+        # 单个读取失败只影响对应的检查项
+        fetched = fetch_all(self.check_queries(company_id), return_exceptions=True)
         results = []
-        for check_name, check_func in checks:
+        for check_name, check_func, data_keys in checks:
             try:
-                result = check_func()
+                data = [fetched[key] for key in data_keys]
+                error = next((item for item in data if isinstance(item, Exception)), None)
+                if error:
+                    raise error
+                
+                result = check_func(*data)
                 results.append((check_name, result))
                 logger.info(f"{'✅' if result else '❌'} {check_name}: {'通过' if result else '失败'}")
             except Exception as e: